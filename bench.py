@@ -0,0 +1,460 @@
+"""Offline benchmark for the forwarding pipeline.
+
+Drives send_to_target, auto_forwarder and handle_admin_messages from
+bot.py against an in-process fake TelegramClient, so hot-path regressions
+show up without a network or a live account.
+
+    python bench.py                         # 10, 1000 and 10000 targets
+    python bench.py --sizes 1000 --latency 0.002 --flood-rate 0.001
+    python bench.py --groups groups.txt --json
+    python bench.py --sizes 10 1000 --write-baseline bench_baseline.json
+    python bench.py --sizes 10 1000 --baseline bench_baseline.json
+    python bench.py --sizes 10 1000 --baseline bench_baseline.json --no-timing-gate   # CI
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from telethon.errors import RPCError, ChatWriteForbiddenError, FloodWaitError
+from telethon.tl.types import Channel, User, InputPeerChat
+
+import bot
+
+DEFAULT_SIZES = (10, 1000, 10000)
+
+# How far a run may drift from the baseline before it counts as a regression.
+# RPC counts are deterministic for a seed; timings vary between machines.
+RPC_TOLERANCE = 0.05
+DURATION_FACTOR = 3.0
+DURATION_FLOOR_S = 0.25
+LAG_FACTOR = 3.0
+LAG_FLOOR_MS = 50.0
+
+
+class FakeMessage:
+    """Just enough of a Telethon Message for the forwarding code"""
+
+    def __init__(self, message_id, chat_id=1, text="📢 Benchmark advert", grouped_id=None):
+        self.id = message_id
+        self.chat_id = chat_id
+        self.text = text
+        self.grouped_id = grouped_id
+        self.media = None
+        self.photo = self.video = self.document = self.sticker = None
+
+    async def get_input_chat(self):
+        return InputPeerChat(self.chat_id)
+
+
+class FakeEvent:
+    def __init__(self, client, sender_id, message):
+        self.client = client
+        self.sender_id = sender_id
+        self.chat_id = message.chat_id
+        self.message = message
+
+    async def reply(self, text):
+        self.client.rpc('reply')
+
+
+class FakeClient:
+    """In-process TelegramClient with latency and error injection
+
+    Failures are picked per destination from a seeded RNG, so every run sees
+    the same TOPIC_CLOSED and permission errors on the same targets.
+    """
+
+    def __init__(self, latency=0.0, flood_rate=0.0, flood_seconds=1,
+                 topic_closed_rate=0.0, forbidden_rate=0.0, seed=1):
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.topic_closed_rate = topic_closed_rate
+        self.forbidden_rate = forbidden_rate
+        self.rng = random.Random(seed)
+        self.seed = seed
+        self.rpcs = {}
+        self.handlers = []
+        self.ids = {}
+
+    def rpc(self, name):
+        self.rpcs[name] = self.rpcs.get(name, 0) + 1
+
+    @property
+    def rpc_count(self):
+        return sum(self.rpcs.values())
+
+    def _peer_id(self, name):
+        if name not in self.ids:
+            self.ids[name] = 1000 + len(self.ids)
+        return self.ids[name]
+
+    def _fate(self, peer_id):
+        """Deterministic failure mode for a destination"""
+        roll = random.Random(peer_id * 7919 + self.seed).random()
+        if roll < self.topic_closed_rate:
+            return 'topic_closed'
+        if roll < self.topic_closed_rate + self.forbidden_rate:
+            return 'forbidden'
+        return None
+
+    async def _send(self, name, entity):
+        self.rpc(name)
+        # Always yield, like a real network round-trip would
+        await asyncio.sleep(self.latency)
+        if self.flood_rate and self.rng.random() < self.flood_rate:
+            raise FloodWaitError(None, capture=self.flood_seconds)
+        fate = self._fate(bot.utils.get_peer_id(entity, add_mark=False))
+        if fate == 'topic_closed':
+            raise RPCError(None, 'TOPIC_CLOSED', 400)
+        if fate == 'forbidden':
+            raise ChatWriteForbiddenError(None)
+
+    # Resolution
+    async def get_entity(self, query):
+        self.rpc('get_entity')
+        await asyncio.sleep(self.latency)
+        if isinstance(query, int):
+            return Channel(id=query, title=f"private {query}", photo=None, date=None,
+                           access_hash=query)
+        name = str(query).rsplit('/', 1)[-1].lstrip('@')
+        peer_id = self._peer_id(name.lower())
+        if name.lower().endswith('bot'):
+            return User(id=peer_id, bot=True, access_hash=peer_id, username=name)
+        return Channel(id=peer_id, title=name, photo=None, date=None,
+                       access_hash=peer_id, username=name)
+
+    async def get_input_entity(self, entity):
+        return bot.utils.get_input_peer(entity)
+
+    async def get_messages(self, chat_id, ids=None):
+        self.rpc('get_messages')
+        if isinstance(ids, list):
+            return [FakeMessage(message_id, chat_id) for message_id in ids]
+        return FakeMessage(ids, chat_id)
+
+    # Sending
+    async def forward_messages(self, entity, messages, **kwargs):
+        await self._send('forward_messages', entity)
+
+    async def send_message(self, entity, message=None, **kwargs):
+        await self._send('send_message', entity)
+
+    async def send_file(self, entity, files, **kwargs):
+        await self._send('send_file', entity)
+
+    async def __call__(self, request):
+        await self._send(type(request).__name__, request.to_peer)
+
+    # Events
+    def on(self, event):
+        def decorator(handler):
+            self.handlers.append(handler)
+            return handler
+        return decorator
+
+
+def synthetic_links(count, seed=1):
+    """groups.txt lines with a realistic mix of topics, chats, private topics and bots"""
+    rng = random.Random(seed)
+    links = []
+    for i in range(count):
+        roll = rng.random()
+        if roll < 0.6:
+            links.append(f"https://t.me/market{i}/{rng.randint(2, 90000)}")
+        elif roll < 0.8:
+            links.append(f"https://t.me/group{i}")
+        elif roll < 0.9:
+            links.append(f"https://t.me/c/{2000000000 + i}/{rng.randint(2, 500)}")
+        else:
+            links.append(f"https://t.me/shop{i}bot")
+    return links
+
+
+def write_groups_file(links, directory):
+    path = os.path.join(directory, f"groups_{len(links)}.txt")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(links))
+    return path
+
+
+def load_targets(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = [line.strip() for line in f if line.strip()]
+    return bot.build_target_table(lines).targets
+
+
+def reset_bot(targets, pace):
+    """Fresh in-memory state so scenarios don't leak into each other"""
+    bot.targets = targets
+    bot.account_states.clear()
+    bot.sent_counters.clear()
+    bot.group_cache = bot.EntityCache(':memory:')
+    bot.state_store = bot.StateStore()
+    bot.metrics = bot.Metrics()
+    bot.settings = bot.DEFAULT_SETTINGS._replace(delay_between_forwards=pace)
+    bot.target_overrides = {}
+    bot.DESTINATION_INTERVAL = pace
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes a short periodic sleep"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.max_lag = 0.0
+        self.task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - started - self.interval
+            self.max_lag = max(self.max_lag, lag)
+
+    def __enter__(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self.task.cancel()
+
+
+async def measure(name, size, client, scenario):
+    """Run one scenario and collect duration, RPCs, memory and loop lag"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    with LoopLagMonitor() as lag:
+        extra = await scenario()
+    duration = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    result = {
+        'scenario': name,
+        'targets': size,
+        'duration_s': round(duration, 4),
+        'rpcs': client.rpc_count,
+        'rpcs_by_type': dict(client.rpcs),
+        'peak_memory_mb': round(peak / 1024 / 1024, 3),
+        'max_loop_lag_ms': round(lag.max_lag * 1000, 3),
+    }
+    result.update(extra or {})
+    return result
+
+
+async def bench_send_pass(targets, client_factory, args):
+    """send_to_target once per target, without the scheduler in between"""
+    reset_bot(targets, args.pace)
+    client = client_factory()
+    message = FakeMessage(1)
+
+    async def scenario():
+        sent = 0
+        for target in targets:
+            success, _, _ = await bot.send_to_target(client, target, message, 'bench')
+            sent += success
+        return {'sent': sent}
+
+    return await measure('send_to_target', len(targets), client, scenario)
+
+
+async def bench_auto_forwarder(targets, client_factory, args):
+    """Scheduler + workers draining one due job per target"""
+    reset_bot(targets, args.pace)
+    client = client_factory()
+    state = bot.account_state('bench')
+    for i in range(1, args.messages + 1):
+        state.latest_messages.add(f"1_{i}_0", bot.StoredMessage.from_message(FakeMessage(i)))
+
+    async def scenario():
+        task = asyncio.create_task(bot.auto_forwarder(client, 'bench', workers=args.workers))
+        deadline = time.time() + args.timeout
+        await asyncio.sleep(0)
+        # Done once every target has been rescheduled into the future
+        while time.time() < deadline:
+            now = time.time()
+            if len(state.scheduler) and min(state.scheduler.due.values()) > now:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+        return {
+            'sent': bot.sent_counters.get('bench', 0),
+            'quarantined': len(state.health.quarantined()),
+            'timed_out': time.time() >= deadline,
+        }
+
+    return await measure('auto_forwarder', len(targets), client, scenario)
+
+
+async def bench_admin_intake(targets, client_factory, args):
+    """Latency of the NewMessage handler for a burst of admin messages"""
+    reset_bot(targets, args.pace)
+    client = client_factory()
+    admin_id = 42
+    await bot.handle_admin_messages(client, [admin_id], 'bench')
+    handler = client.handlers[0]
+    latencies = []
+
+    async def scenario():
+        for i in range(1, args.intake + 1):
+            event = FakeEvent(client, admin_id, FakeMessage(i))
+            started = time.perf_counter()
+            await handler(event)
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        return {
+            'events': len(latencies),
+            'intake_p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+            'intake_max_ms': round(latencies[-1] * 1000, 3),
+        }
+
+    return await measure('handle_admin_messages', len(targets), client, scenario)
+
+
+SCENARIOS = {
+    'send': bench_send_pass,
+    'auto': bench_auto_forwarder,
+    'intake': bench_admin_intake,
+}
+
+
+def print_table(results):
+    header = f"{'scenario':<24}{'targets':>8}{'time s':>10}{'rpcs':>9}{'peak MB':>10}{'lag ms':>9}  extra"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        extra = {k: v for k, v in r.items() if k not in (
+            'scenario', 'targets', 'duration_s', 'rpcs', 'rpcs_by_type',
+            'peak_memory_mb', 'max_loop_lag_ms')}
+        print(f"{r['scenario']:<24}{r['targets']:>8}{r['duration_s']:>10.3f}{r['rpcs']:>9}"
+              f"{r['peak_memory_mb']:>10.2f}{r['max_loop_lag_ms']:>9.2f}  {extra}")
+
+
+def compare(results, baseline, duration_factor=DURATION_FACTOR, lag_factor=LAG_FACTOR):
+    """Compare `results` with `baseline` as (regressions, timing overruns)
+
+    Both are human-readable lines. Timeouts and RPC counts are deterministic
+    for a seed; duration and loop lag depend on the machine, so they are
+    kept apart for the caller to gate on or just report.
+    """
+    expected = {(r['scenario'], r['targets']): r for r in baseline}
+    problems = []
+    timings = []
+    for r in results:
+        name = f"{r['scenario']}@{r['targets']}"
+        if r.get('timed_out'):
+            problems.append(f"{name}: timed out")
+        base = expected.get((r['scenario'], r['targets']))
+        if base is None:
+            continue
+        rpc_limit = base['rpcs'] * (1 + RPC_TOLERANCE)
+        if r['rpcs'] > rpc_limit:
+            problems.append(f"{name}: {r['rpcs']} RPCs (baseline {base['rpcs']})")
+        duration_limit = max(base['duration_s'] * duration_factor, DURATION_FLOOR_S)
+        if r['duration_s'] > duration_limit:
+            timings.append(f"{name}: {r['duration_s']:.3f}s (limit {duration_limit:.3f}s)")
+        lag_limit = max(base['max_loop_lag_ms'] * lag_factor, LAG_FLOOR_MS)
+        if r['max_loop_lag_ms'] > lag_limit:
+            timings.append(f"{name}: {r['max_loop_lag_ms']:.1f}ms loop lag (limit {lag_limit:.1f}ms)")
+    return problems, timings
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help="synthetic target counts to generate")
+    parser.add_argument('--groups', nargs='+', default=[],
+                        help="existing groups.txt files to benchmark instead")
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS),
+                        default=['send', 'auto', 'intake'])
+    parser.add_argument('--latency', type=float, default=0.0, help="fake RPC latency (s)")
+    parser.add_argument('--flood-rate', type=float, default=0.0,
+                        help="probability that a send raises FloodWait")
+    parser.add_argument('--flood-seconds', type=int, default=1)
+    parser.add_argument('--topic-closed-rate', type=float, default=0.05)
+    parser.add_argument('--forbidden-rate', type=float, default=0.02)
+    parser.add_argument('--pace', type=float, default=1e-4,
+                        help="rate limiter interval used instead of the real one (s)")
+    parser.add_argument('--messages', type=int, default=3, help="stored messages for 'auto'")
+    parser.add_argument('--workers', type=int, default=bot.DELIVERY_WORKERS)
+    parser.add_argument('--intake', type=int, default=200, help="admin events for 'intake'")
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help="print results as JSON lines")
+    parser.add_argument('--baseline', metavar='PATH',
+                        help="exit 1 if RPCs, duration or loop lag regress against this file")
+    parser.add_argument('--write-baseline', metavar='PATH',
+                        help="save this run's results as the new baseline")
+    parser.add_argument('--duration-factor', type=float, default=DURATION_FACTOR,
+                        help="allowed slowdown against the baseline duration")
+    parser.add_argument('--lag-factor', type=float, default=LAG_FACTOR,
+                        help="allowed growth of the baseline loop lag")
+    parser.add_argument('--timing-gate', action=argparse.BooleanOptionalAction, default=True,
+                        help="fail on duration/loop lag overruns too (--no-timing-gate only "
+                             "reports them, for shared CI runners)")
+    return parser.parse_args(argv)
+
+
+async def run(args):
+    def client_factory():
+        return FakeClient(latency=args.latency, flood_rate=args.flood_rate,
+                          flood_seconds=args.flood_seconds,
+                          topic_closed_rate=args.topic_closed_rate,
+                          forbidden_rate=args.forbidden_rate, seed=args.seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = list(args.groups) or [
+            write_groups_file(synthetic_links(size, args.seed), directory) for size in args.sizes
+        ]
+        results = []
+        for path in paths:
+            targets = load_targets(path)
+            for name in args.scenarios:
+                results.append(await SCENARIOS[name](targets, client_factory, args))
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Keep the real queue-based pipeline so its cost is measured, minus the output
+    listener = bot.setup_logging(path=None, console=False)
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        listener.stop()
+    if args.json:
+        for result in results:
+            print(json.dumps(result))
+    else:
+        print_table(results)
+    if args.write_baseline:
+        with open(args.write_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        problems, timings = compare(results, baseline, args.duration_factor, args.lag_factor)
+        if args.timing_gate:
+            problems, timings = problems + timings, []
+    else:
+        problems = [f"{r['scenario']}@{r['targets']}: timed out" for r in results if r.get('timed_out')]
+        timings = []
+    for problem in problems:
+        print(f"REGRESSION {problem}", file=sys.stderr)
+    for timing in timings:
+        print(f"SLOWER {timing} (not gated)", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
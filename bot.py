@@ -1,515 +1,2665 @@
 import json
+import argparse
 import asyncio
 import os
+import sys
 import time
 import re
-from telethon import TelegramClient, events
-from telethon.errors import FloodWaitError, ChatWriteForbiddenError, UserBannedInChannelError
+import sqlite3
+import heapq
+import itertools
+import logging
+import queue
+import signal
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from contextlib import contextmanager
+from collections import namedtuple, OrderedDict
+from pathlib import Path
+from telethon import TelegramClient, events, utils
+from telethon.errors import (
+    FloodWaitError, ChatWriteForbiddenError, UserBannedInChannelError,
+    ChannelPrivateError, ChannelInvalidError, UsernameNotOccupiedError,
+    UsernameInvalidError, PeerIdInvalidError, SlowModeWaitError,
+    ChatAdminRequiredError, ChatRestrictedError, ChatGuestSendForbiddenError,
+    ChatSendPlainForbiddenError, UserIsBlockedError, InputUserDeactivatedError,
+    TopicDeletedError, ServerError, TimedOutError, FileReferenceExpiredError
+)
 from telethon.tl.functions.messages import ForwardMessagesRequest
+from telethon.tl.types import (
+    User, Chat, Channel, InputPeerUser, InputPeerChat, InputPeerChannel,
+    MessageMediaPhoto, MessageMediaDocument
+)
 import colorama
 from termcolor import colored
 
 colorama.init()
 
-# Load configuration
+# Configuration files - loaded in main() and re-read when they change on disk
 json_path = os.path.join(os.path.dirname(__file__), 'acc.json')
-try:
-    with open(json_path, 'r', encoding='utf-8') as f:
-        accounts = json.load(f)
-except Exception as e:
-    print(colored(f"❌ Unable to load acc.json: {e}", "red"))
-    exit()
-
-# Load groups.txt
 groups_path = os.path.join(os.path.dirname(__file__), 'groups.txt')
-try:
-    with open(groups_path, 'r', encoding='utf-8') as f:
-        target_links = [line.strip() for line in f.readlines() if line.strip()]
-    print(colored(f"✅ Loaded {len(target_links)} groups from groups.txt", "green"))
-except Exception as e:
-    print(colored(f"❌ Unable to load groups.txt: {e}", "red"))
-    exit()
-
-# Storage
-last_sent_times = {}
-latest_messages = {}
+accounts = []
+target_links = []
+ACCOUNT_FIELDS = ('api_id', 'api_hash', 'phone_number', 'session_name')
+CONFIG_POLL_INTERVAL = 5  # Seconds between mtime checks of acc.json/groups.txt
+
+# Entity cache settings
+state_db_path = os.path.join(os.path.dirname(__file__), 'bot_state.db')
+ENTITY_CACHE_TTL = 24 * 3600      # Keep resolved peers for a day
+NEGATIVE_CACHE_TTL = 6 * 3600     # Don't retry dead usernames for 6 hours
+
+# Errors the copy fallback cannot help with - surface them to the caller
+RATE_LIMIT_ERRORS = (FloodWaitError, SlowModeWaitError)
+
+# Errors that mean a cached peer is no longer usable
+INVALIDATING_ERRORS = (
+    ChannelPrivateError, ChannelInvalidError, UsernameNotOccupiedError,
+    UsernameInvalidError, PeerIdInvalidError
+)
+
+# Error classes: transient errors may succeed via the copy fallback or on
+# the next attempt, retry-later errors need a pause, permanent errors won't
+# go away by retrying and quarantine the target
+TRANSIENT = 'transient'
+RETRY_LATER = 'retry_later'
+PERMANENT = 'permanent'
+
+PERMANENT_ERRORS = INVALIDATING_ERRORS + (
+    ChatWriteForbiddenError, UserBannedInChannelError, ChatAdminRequiredError,
+    ChatRestrictedError, ChatGuestSendForbiddenError, ChatSendPlainForbiddenError,
+    UserIsBlockedError, InputUserDeactivatedError, TopicDeletedError
+)
+PERMANENT_RPC_MESSAGES = {'TOPIC_CLOSED', 'TOPIC_DELETED', 'CHAT_WRITE_FORBIDDEN'}
+RETRY_LATER_ERRORS = RATE_LIMIT_ERRORS + (
+    ServerError, TimedOutError, asyncio.TimeoutError, ConnectionError
+)
+
+def classify_error(error):
+    """Sort a send error into TRANSIENT, RETRY_LATER or PERMANENT"""
+    if isinstance(error, PERMANENT_ERRORS):
+        return PERMANENT
+    if getattr(error, 'message', None) in PERMANENT_RPC_MESSAGES:
+        return PERMANENT
+    if isinstance(error, RETRY_LATER_ERRORS):
+        return RETRY_LATER
+    return TRANSIENT
+
+def describe_error(error):
+    """Short reason shown in summaries"""
+    if isinstance(error, ChatWriteForbiddenError):
+        return "No write permission"
+    if isinstance(error, UserBannedInChannelError):
+        return "User banned"
+    if getattr(error, 'message', None) in PERMANENT_RPC_MESSAGES:
+        return error.message
+    return f"{type(error).__name__}: {str(error)[:40]}"
+
+# State store settings
+STATE_FLUSH_INTERVAL = 5          # Seconds between batched state commits
+STATE_BATCH_SIZE = 100            # Pending writes that force an early commit
+
+# Delivery schedule
+COOLDOWN_PERIOD = 3600            # Minimum gap between sends to one target (and retry delay)
+DELIVERY_WORKERS = 1              # Concurrent delivery workers per account
+BATCH_DELIVERY = True             # Send all stored messages per target in one request
+MAX_FORWARD_BATCH = 100           # Telegram's limit on ids per ForwardMessagesRequest
+
+# Message store limits
+MAX_STORED_MESSAGES = 50          # Hard cap on stored admin messages
+MAX_MESSAGE_AGE = 7 * 24 * 3600   # Drop messages older than a week
+MAX_MESSAGES_PER_CHAT = 10        # Keep only the latest N per admin chat
+MESSAGE_REFRESH_INTERVAL = 600    # Reuse a re-fetched message (and its file references) this long
+
+# Adaptive rate limiting (seconds between sends)
+SEND_INTERVAL = 4                 # Starting gap between sends per account
+MIN_SEND_RATIO = 0.5              # Fastest pace when the server has headroom (x starting gap)
+MAX_SEND_RATIO = 15               # Slowest pace after repeated flood waits (x starting gap)
+ACCOUNT_BURST = 2                 # Sends allowed back-to-back after idling
+DESTINATION_INTERVAL = 30         # Minimum gap between sends to the same chat
+
+# Target health
+TARGET_BACKOFF_BASE = 300         # First retry after a failed send
+TARGET_BACKOFF_MAX = 6 * 3600     # Longest gap between retries
+QUARANTINE_AFTER = 5              # Consecutive failures before quarantine
+QUARANTINE_PERIOD = 24 * 3600     # How long a quarantined target is skipped
+
+# Metrics and console output
+metrics_path = os.path.join(os.path.dirname(__file__), 'metrics.jsonl')
+METRICS_INTERVAL = 60             # Seconds between metric exports
+METRICS_HOST = '127.0.0.1'        # Prometheus-style endpoint (None disables it)
+METRICS_PORT = 9108
+METRICS_CONSOLE = True            # Print a one-line metrics summary on export
+CLEAR_TERMINAL = False            # Wipe the terminal on new cycles (destroys history)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Logging - lines are queued on the event loop and written by a background thread
+log_path = os.path.join(os.path.dirname(__file__), 'telegram_forward_bot.log')
+LOG_MAX_BYTES = 5 * 1024 * 1024   # Rotate the log file at this size
+LOG_BACKUPS = 3                   # Rotated log files kept
+LOG_SAMPLE_WINDOW = 60            # Seconds per sampling window for repetitive lines
+LOG_SAMPLE_BURST = 5              # Lines of one kind let through per window
+LOG_LEVELS = {
+    'DEBUG': logging.DEBUG, 'INFO': logging.INFO, 'WARNING': logging.WARNING,
+    'ERROR': logging.ERROR, 'CRITICAL': logging.CRITICAL
+}
+
+# Dry-run planner output (python bot.py --plan [PATH])
+plan_path = os.path.join(os.path.dirname(__file__), 'delivery_plan.json')
+
+# Shutdown (SIGINT/SIGTERM)
+SHUTDOWN_DRAIN_TIMEOUT = 30       # Seconds in-flight sends get to finish
+SHUTDOWN_DISCONNECT_TIMEOUT = 10  # Seconds clients get to disconnect
+
+# Supervisor backoff when an account's client fails
+RESTART_BACKOFF_MIN = 5
+RESTART_BACKOFF_MAX = 300
+
+# Runtime settings from bot_config.json - the constants above are the defaults
+config_path = os.path.join(os.path.dirname(__file__), 'bot_config.json')
+Settings = namedtuple('Settings', [
+    'delay_between_forwards',  # Starting gap between sends per account
+    'cooldown_period',         # Gap between sends to one target, also the retry delay
+    'max_retries',             # Consecutive failures before a target is quarantined
+    'enable_drop_author',      # Forward without the "Forwarded from" header
+    'enable_silent_mode',      # Deliver without a notification
+    'log_level',               # Lowest level logged (per target: lines about that target)
+])
+DEFAULT_SETTINGS = Settings(SEND_INTERVAL, COOLDOWN_PERIOD, QUARANTINE_AFTER, False, False, logging.INFO)
+SETTING_RULES = {                 # name -> (accepted types, minimum, minimum excluded)
+    'delay_between_forwards': ((int, float), 0, True),
+    'cooldown_period': ((int, float), 0, False),
+    'max_retries': (int, 1, False),
+    'enable_drop_author': (bool, None, False),
+    'enable_silent_mode': (bool, None, False),
+    'log_level': (str, None, False),
+}
+# Pacing is per account, so per-target overrides can only change these
+TARGET_SETTINGS = ('cooldown_period', 'max_retries', 'enable_drop_author', 'enable_silent_mode', 'log_level')
+settings = DEFAULT_SETTINGS
+target_overrides = {}             # target identity -> Settings
+
+# Storage (per-account state lives in account_states)
 sent_counters = {}
-group_cache = {}
-last_terminal_clear = time.time()
-is_forwarding = False
-message_queue = []
+account_states = {}
+
+log = logging.getLogger('forwarder')
+log_listener = None
+
+def emit(message, color=None, attrs=None, level=None, target=None, sample=None):
+    """Queue a console/log line; the event loop never waits on output
+
+    Red lines default to ERROR, everything else to INFO. `target` applies
+    that target's log level, `sample` names a kind of repetitive line that
+    is rate-limited by SamplingFilter.
+    """
+    if level is None:
+        level = logging.ERROR if color == 'red' else logging.INFO
+    log.log(level, message, extra={'color': color, 'attrs': attrs, 'target': target, 'sample': sample})
 
 def clear_terminal():
-    os.system('cls' if os.name == 'nt' else 'clear')
+    """Have the console handler wipe the screen (no shell is spawned)"""
+    if CLEAR_TERMINAL:
+        log.info("", extra={'clear': True})
 
-def parse_telegram_link(link):
-    """Enhanced Telegram link parsing with bot support"""
-    link = link.strip()
+class TargetLevelFilter(logging.Filter):
+    """Apply per-target log levels, and the global level to everything else"""
+
+    def filter(self, record):
+        target = getattr(record, 'target', None)
+        options = target_settings(target) if target is not None else settings
+        return record.levelno >= options.log_level
+
+class SamplingFilter(logging.Filter):
+    """Let `burst` lines of each sampled kind through per window
+
+    The first line of the next window reports how many were dropped.
+    """
+
+    def __init__(self, window=LOG_SAMPLE_WINDOW, burst=LOG_SAMPLE_BURST):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.windows = {}  # kind -> [window start, lines seen, lines dropped]
+
+    def filter(self, record):
+        kind = getattr(record, 'sample', None)
+        if kind is None:
+            return True
+        entry = self.windows.get(kind)
+        if entry is None or record.created - entry[0] >= self.window:
+            dropped = entry[2] if entry else 0
+            self.windows[kind] = [record.created, 1, 0]
+            if dropped:
+                record.msg = f"{record.msg} (+{dropped} similar lines suppressed)"
+            return True
+        entry[1] += 1
+        if entry[1] <= self.burst:
+            return True
+        entry[2] += 1
+        return False
+
+class ColorFormatter(logging.Formatter):
+    """Keep the console colours; other libraries' records get a level colour"""
+    LEVEL_COLORS = {logging.WARNING: 'yellow', logging.ERROR: 'red', logging.CRITICAL: 'red'}
+
+    def format(self, record):
+        text = super().format(record)
+        color = getattr(record, 'color', None) or self.LEVEL_COLORS.get(record.levelno)
+        if not color:
+            return text
+        return colored(text, color, attrs=getattr(record, 'attrs', None))
+
+class ConsoleHandler(logging.StreamHandler):
+    """Console output that understands clear-screen requests"""
+
+    def emit(self, record):
+        if getattr(record, 'clear', False):
+            self.stream.write("\033[2J\033[H")
+            self.flush()
+            return
+        super().emit(record)
+
+def apply_log_levels():
+    """Sync logger levels with the loaded settings"""
+    logging.getLogger().setLevel(settings.log_level)
+    # Targets may ask for more detail than the global level
+    log.setLevel(min([settings.log_level] + [options.log_level for options in target_overrides.values()]))
+
+def setup_logging(path=log_path, console=True):
+    """Send all logging through a queue drained by a listener thread
+
+    The console gets this bot's lines plus warnings from libraries; the
+    rotating log file gets everything at or above the configured level.
+    """
+    global log_listener
+    handlers = []
+    if console:
+        handler = ConsoleHandler(sys.stdout)
+        handler.setFormatter(ColorFormatter('%(message)s'))
+        handler.addFilter(lambda record: record.name == log.name or record.levelno >= logging.WARNING)
+        handlers.append(handler)
+    if path:
+        handler = RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS,
+                                      encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        handler.addFilter(lambda record: not getattr(record, 'clear', False))
+        handlers.append(handler)
     
-    # Pattern for bot deep links
-    bot_pattern = r'https?://t\.me/([a-zA-Z0-9_]+bot)(?:\?start=.*|/start.*)?'
-    # Pattern for topic links
-    topic_pattern = r'https?://t\.me/([a-zA-Z0-9_]+)/(\d+)'
-    # Pattern for private links
-    private_pattern = r'https?://t\.me/c/(\d+)/(\d+)'
-    # Pattern for username only
-    username_pattern = r'@?([a-zA-Z0-9_]+)'
-    # Pattern for full URLs with usernames
-    url_pattern = r'https?://t\.me/([a-zA-Z0-9_]+)'
+    queue_handler = QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(TargetLevelFilter())
+    queue_handler.addFilter(SamplingFilter())
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    apply_log_levels()
     
-    # Try bot pattern first
-    bot_match = re.match(bot_pattern, link)
-    if bot_match:
-        bot_username = bot_match.group(1)
+    if log_listener:
+        log_listener.stop()
+    log_listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    log_listener.start()
+    return log_listener
+
+class Histogram:
+    """Cumulative-bucket latency histogram"""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+class Metrics:
+    """Counters, gauges and latency histograms for the delivery pipeline"""
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name='rpc_latency_seconds', **labels):
+        """Observe how long the wrapped block took (works around awaits)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def counter_total(self, name, **labels):
+        """Sum of a counter across every label set matching `labels`"""
+        wanted = set(labels.items())
+        return sum(value for (key_name, key_labels), value in self.counters.items()
+                   if key_name == name and wanted <= set(key_labels))
+
+    def snapshot(self):
+        """JSON-friendly view of every metric"""
+        def series(items, render):
+            return [{'name': name, 'labels': dict(labels), **render(value)}
+                    for (name, labels), value in items]
         return {
-            'type': 'bot',
-            'username': bot_username,
-            'original_link': link
+            'ts': time.time(),
+            'counters': series(self.counters.items(), lambda v: {'value': v}),
+            'gauges': series(self.gauges.items(), lambda v: {'value': v}),
+            'histograms': series(self.histograms.items(), lambda h: {
+                'count': h.count, 'sum': round(h.sum, 6),
+                'buckets': dict(zip(map(str, h.buckets), h.counts))
+            })
         }
-    
-    # Try topic pattern
-    topic_match = re.match(topic_pattern, link)
-    if topic_match:
-        username = topic_match.group(1)
-        topic_id = int(topic_match.group(2))
+
+    def render_prometheus(self):
+        """Prometheus text exposition format"""
+        def fmt(name, labels, value, extra=()):
+            pairs = list(labels) + list(extra)
+            label_text = ",".join(f'{k}="{v}"' for k, v in pairs)
+            return f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}"
+
+        lines = []
+        for kind, items in (('counter', self.counters), ('gauge', self.gauges)):
+            for name in sorted({name for name, _ in items}):
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(fmt(name, labels, value)
+                             for (key_name, labels), value in items.items() if key_name == name)
+        for name in sorted({name for name, _ in self.histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (key_name, labels), h in self.histograms.items():
+                if key_name != name:
+                    continue
+                for bound, count in zip(h.buckets, h.counts):
+                    lines.append(fmt(f"{name}_bucket", labels, count, [('le', bound)]))
+                lines.append(fmt(f"{name}_bucket", labels, h.count, [('le', '+Inf')]))
+                lines.append(fmt(f"{name}_sum", labels, round(h.sum, 6)))
+                lines.append(fmt(f"{name}_count", labels, h.count))
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+class EntityCache:
+    """Persistent resolved-entity cache with TTL and negative entries
+
+    Lookups are served from memory; writes are batched like the state
+    store's and committed by flush(). `db` reuses an open connection
+    instead of connecting to `path`.
+    """
+
+    def __init__(self, path, ttl=ENTITY_CACHE_TTL, negative_ttl=NEGATIVE_CACHE_TTL,
+                 batch_size=STATE_BATCH_SIZE, db=None):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.batch_size = batch_size
+        self.entries = {}
+        self.pending = []
+        self.db = db if db is not None else sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS entity_cache ("
+            " session TEXT NOT NULL,"
+            " link_key TEXT NOT NULL,"
+            " peer_type TEXT,"
+            " peer_id INTEGER,"
+            " access_hash INTEGER,"
+            " title TEXT,"
+            " resolved_at REAL NOT NULL,"
+            " PRIMARY KEY (session, link_key))"
+        )
+        self.db.commit()
+        for row in self.db.execute(
+                "SELECT session, link_key, peer_type, peer_id, access_hash, title, resolved_at "
+                "FROM entity_cache"):
+            self.entries[(row[0], row[1])] = {
+                'peer_type': row[2],
+                'peer_id': row[3],
+                'access_hash': row[4],
+                'title': row[5],
+                'resolved_at': row[6]
+            }
+
+    def get(self, session_name, link_key):
+        """Return a fresh entry, or None if missing or expired"""
+        entry = self.peek(session_name, link_key)
+        if entry is None and (session_name, link_key) in self.entries:
+            self.invalidate(session_name, link_key)
+        return entry
+
+    def peek(self, session_name, link_key):
+        """Like get(), but leaves expired entries in place (read-only)"""
+        entry = self.entries.get((session_name, link_key))
+        if not entry:
+            return None
+        ttl = self.ttl if entry['peer_type'] else self.negative_ttl
+        if time.time() - entry['resolved_at'] >= ttl:
+            return None
+        return entry
+
+    @staticmethod
+    def make_entry(entity):
+        """Cache entry (peer id + access hash) for a resolved entity"""
+        if isinstance(entity, User):
+            peer_type = 'user'
+        elif isinstance(entity, Chat):
+            peer_type = 'chat'
+        else:
+            peer_type = 'channel'
         return {
-            'type': 'topic',
-            'username': username,
-            'topic_id': topic_id,
-            'original_link': link
+            'peer_type': peer_type,
+            'peer_id': entity.id,
+            'access_hash': getattr(entity, 'access_hash', None),
+            'title': getattr(entity, 'title', None) or getattr(entity, 'username', None),
+            'resolved_at': time.time()
+        }
+
+    def put(self, session_name, link_key, entity):
+        """Store a resolved entity as peer id + access hash"""
+        self._store(session_name, link_key, self.make_entry(entity))
+
+    def put_many(self, session_name, items):
+        """Store (link_key, entity) pairs in a single transaction"""
+        for link_key, entity in items:
+            self._store(session_name, link_key, self.make_entry(entity))
+        self.flush()
+
+    def put_negative(self, session_name, link_key):
+        """Remember that a link could not be resolved"""
+        entry = {
+            'peer_type': None,
+            'peer_id': None,
+            'access_hash': None,
+            'title': None,
+            'resolved_at': time.time()
         }
+        self._store(session_name, link_key, entry)
+
+    def invalidate(self, session_name, link_key):
+        if self.entries.pop((session_name, link_key), None) is not None:
+            self._write("DELETE FROM entity_cache WHERE session = ? AND link_key = ?",
+                        (session_name, link_key))
+
+    def _store(self, session_name, link_key, entry):
+        self.entries[(session_name, link_key)] = entry
+        self._write("INSERT OR REPLACE INTO entity_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (session_name, link_key, entry['peer_type'], entry['peer_id'],
+                     entry['access_hash'], entry['title'], entry['resolved_at']))
+
+    def _write(self, sql, params):
+        self.pending.append((sql, params))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Commit every pending write in a single transaction"""
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        try:
+            with self.db:
+                for sql, params in batch:
+                    self.db.execute(sql, params)
+        except sqlite3.Error as e:
+            # Keep the batch so the next flush retries it
+            self.pending = batch + self.pending
+            emit(f"❌ Failed to save entity cache: {e}", "red")
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    @staticmethod
+    def to_input_peer(entry):
+        """Rebuild an input peer from a cached entry"""
+        if entry['peer_type'] == 'user':
+            return InputPeerUser(entry['peer_id'], entry['access_hash'] or 0)
+        if entry['peer_type'] == 'chat':
+            return InputPeerChat(entry['peer_id'])
+        return InputPeerChannel(entry['peer_id'], entry['access_hash'] or 0)
+
+# In-memory until open_state() loads the real database
+group_cache = EntityCache(':memory:')
+
+class MediaDescriptor:
+    """What kind of media a stored message carries - no file references"""
+    __slots__ = ('kind', 'media_id')
+
+    def __init__(self, kind, media_id=None):
+        self.kind = kind
+        self.media_id = media_id
+
+    @classmethod
+    def from_message(cls, message):
+        for kind in ('photo', 'video', 'sticker', 'document'):
+            media = getattr(message, kind, None)
+            if media:
+                return cls(kind, getattr(media, 'id', None))
+        return cls('media') if getattr(message, 'media', None) else None
+
+class StoredMessage:
+    """Compact record of an admin message; the live Message is fetched on demand"""
+    __slots__ = ('chat_id', 'message_id', 'text', 'media', 'grouped_id')
+
+    def __init__(self, chat_id, message_id, text=None, media=None, grouped_id=None):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = text
+        self.media = media
+        self.grouped_id = grouped_id
+
+    @classmethod
+    def from_message(cls, message):
+        return cls(message.chat_id, message.id, message.text or None,
+                   MediaDescriptor.from_message(message), getattr(message, 'grouped_id', None))
+
+class StateStore:
+    """In-memory state store: keeps nothing across restarts.
+
+    Subclasses persist cooldowns, stored messages, per-target deliveries
+    and sent counters so a restart picks up where the last run stopped.
+    Everything except the counters is kept per session.
+    """
+
+    def load(self):
+        """Return all saved state in one read
+
+        'messages' maps session -> message key -> (StoredMessage, stored_at),
+        'sent_log' maps session -> target key -> message key -> sent_at.
+        """
+        return {
+            'last_sent_times': {},
+            'messages': {},
+            'sent_counters': {},
+            'target_health': {},
+            'sent_log': {}
+        }
+
+    def set_cooldown(self, session_name, entity_key, sent_at):
+        pass
+
+    def add_message(self, session_name, message_key, stored):
+        pass
+
+    def remove_message(self, session_name, message_key):
+        pass
+
+    def set_counter(self, session_name, count):
+        pass
+
+    def set_health(self, session_name, target_key, record):
+        pass
+
+    def clear_health(self, session_name, target_key):
+        pass
+
+    def record_delivery(self, session_name, target_key, message_key, sent_at):
+        pass
+
+    def clear_deliveries(self, session_name, target_key):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+class SQLiteStateStore(StateStore):
+    """SQLite-backed state store with batched, crash-safe commits"""
+
+    def __init__(self, path, batch_size=STATE_BATCH_SIZE, db=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = []
+        self.db = db if db is not None else sqlite3.connect(path)
+        # WAL keeps the last committed batch intact if the process dies mid-write
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        # Older databases kept a message queue nothing ever read
+        self.db.execute("DROP TABLE IF EXISTS message_queue")
+        self.db.executescript(
+            "CREATE TABLE IF NOT EXISTS cooldowns ("
+            " session TEXT NOT NULL, entity_key TEXT NOT NULL, sent_at REAL NOT NULL,"
+            " PRIMARY KEY (session, entity_key));"
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " session TEXT NOT NULL, message_key TEXT NOT NULL, chat_id INTEGER NOT NULL,"
+            " message_id INTEGER NOT NULL, stored_at REAL NOT NULL, text TEXT,"
+            " media_kind TEXT, media_id INTEGER, grouped_id INTEGER,"
+            " PRIMARY KEY (session, message_key));"
+            "CREATE TABLE IF NOT EXISTS counters ("
+            " session TEXT PRIMARY KEY, sent INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS target_health ("
+            " session TEXT NOT NULL, target_key TEXT NOT NULL, failures INTEGER NOT NULL,"
+            " retry_at REAL NOT NULL, quarantined INTEGER NOT NULL, reason TEXT,"
+            " PRIMARY KEY (session, target_key));"
+            "CREATE TABLE IF NOT EXISTS deliveries ("
+            " session TEXT NOT NULL, target_key TEXT NOT NULL, message_key TEXT NOT NULL,"
+            " sent_at REAL NOT NULL, PRIMARY KEY (session, target_key, message_key));"
+        )
+        # Older databases stored only the message reference
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(messages)")}
+        for column, kind in (('text', 'TEXT'), ('media_kind', 'TEXT'),
+                             ('media_id', 'INTEGER'), ('grouped_id', 'INTEGER')):
+            if column not in columns:
+                self.db.execute(f"ALTER TABLE messages ADD COLUMN {column} {kind}")
+        self.db.commit()
+
+    def load(self):
+        state = super().load()
+        for session, entity_key, sent_at in self.db.execute(
+                "SELECT session, entity_key, sent_at FROM cooldowns"):
+            state['last_sent_times'].setdefault(session, {})[entity_key] = sent_at
+        for (session, message_key, chat_id, message_id, stored_at, text,
+             media_kind, media_id, grouped_id) in self.db.execute(
+                "SELECT session, message_key, chat_id, message_id, stored_at, text,"
+                " media_kind, media_id, grouped_id FROM messages ORDER BY stored_at"):
+            media = MediaDescriptor(media_kind, media_id) if media_kind else None
+            state['messages'].setdefault(session, {})[message_key] = (
+                StoredMessage(chat_id, message_id, text, media, grouped_id), stored_at)
+        for session, sent in self.db.execute("SELECT session, sent FROM counters"):
+            state['sent_counters'][session] = sent
+        for session, key, failures, retry_at, quarantined, reason in self.db.execute(
+                "SELECT session, target_key, failures, retry_at, quarantined, reason "
+                "FROM target_health"):
+            state['target_health'].setdefault(session, {})[key] = (
+                failures, retry_at, bool(quarantined), reason)
+        for session, key, message_key, sent_at in self.db.execute(
+                "SELECT session, target_key, message_key, sent_at FROM deliveries"):
+            state['sent_log'].setdefault(session, {}).setdefault(key, {})[message_key] = sent_at
+        return state
+
+    def set_cooldown(self, session_name, entity_key, sent_at):
+        self._write("INSERT OR REPLACE INTO cooldowns VALUES (?, ?, ?)",
+                    (session_name, entity_key, sent_at))
+
+    def add_message(self, session_name, message_key, stored):
+        media = stored.media
+        self._write("INSERT OR REPLACE INTO messages (session, message_key, chat_id, message_id,"
+                    " stored_at, text, media_kind, media_id, grouped_id)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (session_name, message_key, stored.chat_id, stored.message_id, time.time(),
+                     stored.text, media.kind if media else None,
+                     media.media_id if media else None, stored.grouped_id))
+
+    def remove_message(self, session_name, message_key):
+        self._write("DELETE FROM messages WHERE session = ? AND message_key = ?",
+                    (session_name, message_key))
+        self._write("DELETE FROM deliveries WHERE session = ? AND message_key = ?",
+                    (session_name, message_key))
+
+    def set_counter(self, session_name, count):
+        self._write("INSERT OR REPLACE INTO counters VALUES (?, ?)", (session_name, count))
+
+    def set_health(self, session_name, target_key, record):
+        self._write("INSERT OR REPLACE INTO target_health VALUES (?, ?, ?, ?, ?, ?)",
+                    (session_name, target_key, record.failures, record.retry_at,
+                     int(record.quarantined), record.reason))
+
+    def clear_health(self, session_name, target_key):
+        self._write("DELETE FROM target_health WHERE session = ? AND target_key = ?",
+                    (session_name, target_key))
+
+    def record_delivery(self, session_name, target_key, message_key, sent_at):
+        self._write("INSERT OR REPLACE INTO deliveries VALUES (?, ?, ?, ?)",
+                    (session_name, target_key, message_key, sent_at))
+
+    def clear_deliveries(self, session_name, target_key):
+        self._write("DELETE FROM deliveries WHERE session = ? AND target_key = ?",
+                    (session_name, target_key))
+
+    def _write(self, sql, params):
+        self.pending.append((sql, params))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Commit every pending write in a single transaction"""
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        try:
+            with self.db:
+                for sql, params in batch:
+                    self.db.execute(sql, params)
+        except sqlite3.Error as e:
+            # Keep the batch so the next flush retries it
+            self.pending = batch + self.pending
+            emit(f"❌ Failed to save state: {e}", "red")
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+state_store = StateStore()
+
+def open_state(path=state_db_path, read_only=False):
+    """Open the entity cache and state store on the SQLite database at `path`
+
+    read_only works on an in-memory snapshot of the database (empty if there
+    is none yet), so neither migrations nor writes ever reach the file.
+    """
+    global group_cache, state_store
+    group_cache.close()
+    state_store.close()
+    if read_only:
+        db = sqlite3.connect(':memory:')
+        if os.path.exists(path):
+            source = sqlite3.connect(f"{Path(path).absolute().as_uri()}?mode=ro", uri=True)
+            try:
+                source.backup(db)
+            finally:
+                source.close()
+        group_cache = EntityCache(path, db=db)
+        state_store = SQLiteStateStore(path, db=db)
+    else:
+        group_cache = EntityCache(path)
+        state_store = SQLiteStateStore(path)
+
+class MessageStore:
+    """Bounded store of admin messages with LRU and age eviction"""
+
+    def __init__(self, max_entries=MAX_STORED_MESSAGES, max_age=MAX_MESSAGE_AGE,
+                 per_chat_limit=MAX_MESSAGES_PER_CHAT, on_evict=None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.per_chat_limit = per_chat_limit
+        self.on_evict = on_evict
+        self.entries = OrderedDict()
+        self.stored_at = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, message_key):
+        return message_key in self.entries
+
+    def __getitem__(self, message_key):
+        return self.entries[message_key]
+
+    def __setitem__(self, message_key, message):
+        if message_key in self.entries:
+            # Replacing an entry keeps its position
+            self.entries[message_key] = message
+        else:
+            self.add(message_key, message)
+
+    def keys(self):
+        return list(self.entries.keys())
+
+    def items(self):
+        return list(self.entries.items())
+
+    def by_stored_at(self):
+        """Keys oldest first by store time - stable however messages are used"""
+        return sorted(self.entries, key=self.stored_at.__getitem__)
+
+    def get(self, message_key, default=None):
+        """Return a message and mark it as recently used"""
+        if message_key not in self.entries:
+            return default
+        self.entries.move_to_end(message_key)
+        return self.entries[message_key]
+
+    def add(self, message_key, message, stored_at=None):
+        """Store a message, then evict whatever is over the limits"""
+        self.entries[message_key] = message
+        self.stored_at[message_key] = stored_at or time.time()
+        self.evict(keep=message_key)
+
+    def remove(self, message_key, reason="deleted"):
+        if message_key not in self.entries:
+            return False
+        del self.entries[message_key]
+        del self.stored_at[message_key]
+        if self.on_evict:
+            self.on_evict(message_key, reason)
+        return True
+
+    def evict(self, keep=None):
+        """Apply age, per-chat and size limits; returns evicted count"""
+        evicted = 0
+        now = time.time()
+        for message_key in list(self.entries):
+            if message_key != keep and now - self.stored_at[message_key] > self.max_age:
+                evicted += self.remove(message_key, "expired")
+
+        # Newest first by store time, not by use, so the latest N per chat stay
+        per_chat = {}
+        for message_key in reversed(self.by_stored_at()):
+            chat_id = getattr(self.entries[message_key], 'chat_id', None)
+            per_chat.setdefault(chat_id, []).append(message_key)
+        for keys in per_chat.values():
+            for message_key in keys[self.per_chat_limit:]:
+                if message_key != keep:
+                    evicted += self.remove(message_key, "chat limit")
+
+        while len(self.entries) > self.max_entries:
+            message_key = next(iter(self.entries))
+            if message_key == keep:
+                self.entries.move_to_end(message_key)
+                continue
+            evicted += self.remove(message_key, "store full")
+        return evicted
+
+class TokenBucket:
+    """Token bucket that hands out reservations instead of blocking"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        """Take a token; returns how many seconds to wait before using it"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def drain(self, seconds):
+        """Push the next free token at least `seconds` into the future"""
+        self.reserve()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+class RateLimiter:
+    """FloodWait-aware pacing for one account.
+
+    One bucket paces the whole account and one bucket per destination chat
+    spaces out sends to its topics. The account interval shrinks a little
+    after every success and doubles whenever the server pushes back, staying
+    within MIN_SEND_RATIO..MAX_SEND_RATIO of the starting interval.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval or settings.delay_between_forwards
+        self.min_interval = self.interval * MIN_SEND_RATIO
+        self.max_interval = self.interval * MAX_SEND_RATIO
+        self.account = TokenBucket(1 / self.interval, ACCOUNT_BURST)
+        self.destinations = {}
+        self.paused_until = 0
+
+    def is_paused(self, now=None):
+        return (now or time.time()) < self.paused_until
+
+    def destination(self, destination_id):
+        bucket = self.destinations.get(destination_id)
+        if bucket is None:
+            bucket = self.destinations[destination_id] = TokenBucket(1 / DESTINATION_INTERVAL, 1)
+        return bucket
+
+    async def acquire(self, destination_id):
+        """Wait for a pause to end and for both buckets; returns seconds waited"""
+        started = time.time()
+        while self.is_paused():
+            await asyncio.sleep(self.paused_until - time.time())
+        delay = max(self.account.reserve(), self.destination(destination_id).reserve())
+        if delay:
+            await asyncio.sleep(delay)
+        return time.time() - started
+
+    def on_success(self):
+        self._set_interval(self.interval * 0.95)
+
+    def on_flood_wait(self, seconds):
+        """Stop the account for exactly the requested time and slow down"""
+        self.paused_until = max(self.paused_until, time.time() + seconds)
+        self._set_interval(self.interval * 2)
+        emit(f"🛑 Flood wait: pausing account for {seconds}s, "
+             f"send interval now {self.interval:.1f}s", "red")
+
+    def on_slow_mode(self, destination_id, seconds):
+        self.destination(destination_id).drain(seconds)
+
+    def _set_interval(self, interval):
+        self.interval = min(self.max_interval, max(self.min_interval, interval))
+        self.account.rate = 1 / self.interval
+
+def target_key(target):
+    """Stable string key for a target (used by health records and the sent log)"""
+    return identity_key(target_identity(target))
+
+def identity_key(identity):
+    return "|".join("" if part is None else str(part) for part in identity)
+
+class TargetHealth:
+    """Failure history of one target"""
+    __slots__ = ('failures', 'retry_at', 'quarantined', 'reason')
+
+    def __init__(self, failures=0, retry_at=0, quarantined=False, reason=None):
+        self.failures = failures
+        self.retry_at = retry_at
+        self.quarantined = quarantined
+        self.reason = reason
+
+class HealthTracker:
+    """Per-target backoff and quarantine for one account"""
+
+    def __init__(self, session_name):
+        self.session_name = session_name
+        self.records = {}
+
+    def get(self, target):
+        return self.records.get(target_key(target))
+
+    def retry_at(self, target):
+        record = self.get(target)
+        return record.retry_at if record else 0
+
+    def record_success(self, target):
+        key = target_key(target)
+        if self.records.pop(key, None) is not None:
+            state_store.clear_health(self.session_name, key)
+
+    def defer(self, target, seconds):
+        """Hold a target back without counting a failure"""
+        key = target_key(target)
+        record = self.records.setdefault(key, TargetHealth())
+        record.retry_at = max(record.retry_at, time.time() + seconds)
+        state_store.set_health(self.session_name, key, record)
+
+    def record_failure(self, target, reason, outcome):
+        """Back off exponentially; quarantine permanent or repeated failures"""
+        if outcome == RETRY_LATER:
+            self.defer(target, TARGET_BACKOFF_BASE)
+            return
+        key = target_key(target)
+        record = self.records.setdefault(key, TargetHealth())
+        record.failures += 1
+        record.reason = reason
+        now = time.time()
+        if outcome == PERMANENT or record.failures >= target_settings(target).max_retries:
+            record.quarantined = True
+            record.retry_at = now + QUARANTINE_PERIOD
+            emit(f"🚫 Quarantined {target.original_link} for "
+                 f"{QUARANTINE_PERIOD // 3600}h: {reason}", "red", target=target)
+        else:
+            backoff = TARGET_BACKOFF_BASE * 2 ** (record.failures - 1)
+            record.retry_at = now + min(backoff, TARGET_BACKOFF_MAX)
+        state_store.set_health(self.session_name, key, record)
+
+    def quarantined(self):
+        """(target key, record) pairs for every quarantined target"""
+        return [(key, record) for key, record in self.records.items() if record.quarantined]
+
+def print_health_summary(session_name):
+    """List disabled targets and why"""
+    quarantined = account_state(session_name).health.quarantined()
+    if not quarantined:
+        return
+    emit(f"\n🚫 Quarantined targets ({len(quarantined)}):", "red")
+    for key, record in quarantined:
+        until = time.strftime('%d %b %H:%M', time.localtime(record.retry_at))
+        emit(f"   • {key}: {record.reason} (until {until})", "red")
+
+class AccountState:
+    """Runtime state owned by one account - nothing here is shared between clients"""
+
+    def __init__(self, session_name):
+        self.session_name = session_name
+        self.last_sent_times = {}
+        self.latest_messages = MessageStore(on_evict=self.forget_message)
+        self.live_messages = {}
+        self.admin_ids = set()
+        self.limiter = RateLimiter()
+        self.health = HealthTracker(session_name)
+        self.scheduler = DeliveryScheduler(self)
+
+    def forget_message(self, message_key, reason):
+        """Drop an evicted message from the live cache and the state store"""
+        self.live_messages.pop(message_key, None)
+        state_store.remove_message(self.session_name, message_key)
+        emit(f"🗑️ Removed stored message {message_key} ({reason})", "yellow")
+
+    def release_live_messages(self, now=None):
+        """Drop live Messages that would be re-fetched before their next use
+
+        Entries past MESSAGE_REFRESH_INTERVAL are stale anyway, and when no
+        job is due within the interval every entry would be, so all go.
+        """
+        now = now or time.time()
+        job = self.scheduler.peek()
+        if job is None or job[0] - now >= MESSAGE_REFRESH_INTERVAL:
+            self.live_messages.clear()
+            return
+        for message_key, (_, fetched_at) in list(self.live_messages.items()):
+            if now - fetched_at >= MESSAGE_REFRESH_INTERVAL:
+                del self.live_messages[message_key]
+
+def account_state(session_name):
+    """State for one account, created on first use"""
+    state = account_states.get(session_name)
+    if state is None:
+        state = account_states[session_name] = AccountState(session_name)
+    return state
+
+def restore_state(persist=True):
+    """Load saved cooldowns, messages, deliveries and counters in one bulk read
+
+    With persist=False messages past the store limits are dropped from
+    memory only - eviction doesn't delete them from the state store.
+    """
+    saved = state_store.load()
+    for session_name, cooldowns in saved['last_sent_times'].items():
+        account_state(session_name).last_sent_times.update(cooldowns)
+    for session_name, messages in saved['messages'].items():
+        store = account_state(session_name).latest_messages
+        on_evict = store.on_evict
+        if not persist:
+            store.on_evict = None
+        for message_key, (ref, stored_at) in messages.items():
+            store.add(message_key, ref, stored_at)
+        store.on_evict = on_evict
+    for session_name, records in saved['target_health'].items():
+        health = account_state(session_name).health
+        for key, fields in records.items():
+            health.records[key] = TargetHealth(*fields)
+    for session_name, sent_log in saved['sent_log'].items():
+        account_state(session_name).scheduler.sent_log.update(sent_log)
+    sent_counters.update(saved['sent_counters'])
+    return saved
+
+async def rehydrate(client, state, message_keys):
+    """Live Message objects for stored keys, as {message_key: Message}
+
+    Messages not fetched within MESSAGE_REFRESH_INTERVAL are re-fetched with
+    one get_messages call per source chat, so their file references are
+    fresh. Originals the admin deleted are dropped from the store.
+    """
+    now = time.time()
+    live = state.live_messages
+    wanted = {}
+    for message_key in message_keys:
+        stored = state.latest_messages.get(message_key)
+        if stored is None:
+            continue
+        cached = live.get(message_key)
+        if cached is None or now - cached[1] >= MESSAGE_REFRESH_INTERVAL:
+            wanted.setdefault(stored.chat_id, []).append((message_key, stored.message_id))
     
-    # Try private pattern
-    private_match = re.match(private_pattern, link)
+    for chat_id, refs in wanted.items():
+        with metrics.timer(rpc='get_messages'):
+            fetched = await client.get_messages(chat_id, ids=[message_id for _, message_id in refs])
+        for (message_key, _), message in zip(refs, fetched):
+            if message is None:
+                # The admin deleted the original - nothing left to forward
+                state.latest_messages.remove(message_key, "original deleted")
+            else:
+                live[message_key] = (message, now)
+    return {key: live[key][0] for key in message_keys if key in live}
+
+async def state_flusher():
+    """Periodically commit batched state writes"""
+    while True:
+        await asyncio.sleep(STATE_FLUSH_INTERVAL)
+        state_store.flush()
+        group_cache.flush()
+
+def entity_cache_key(link_info):
+    """Cache key for a parsed link (topics share their chat's entry)"""
+    if link_info.type == 'private_topic':
+        return f"c/{link_info.channel_id}"
+    return link_info.username.lower()
+
+def entity_display_name(entity, link_info, session_name=None):
+    """Best human-readable name for a resolved or cached entity"""
+    name = getattr(entity, 'title', None) or getattr(entity, 'username', None)
+    if not name and session_name:
+        entry = group_cache.get(session_name, entity_cache_key(link_info))
+        name = entry['title'] if entry else None
+    return name or link_info.original_link
+
+# Link patterns, compiled once at import
+BOT_PATTERN = re.compile(r'(?:https?://)?t\.me/([a-zA-Z0-9_]+[Bb][Oo][Tt])(?:[?/]start.*)?/?$')
+PRIVATE_PATTERN = re.compile(r'(?:https?://)?t\.me/c/(\d+)/(\d+)(?:[/?].*)?$')
+TOPIC_PATTERN = re.compile(r'(?:https?://)?t\.me/([a-zA-Z0-9_]+)/(\d+)(?:[/?].*)?$')
+URL_PATTERN = re.compile(r'(?:https?://)?t\.me/([a-zA-Z0-9_]+)/?(?:\?.*)?$')
+USERNAME_PATTERN = re.compile(r'@?([a-zA-Z0-9_]+)$')
+
+# One parsed line of groups.txt
+Target = namedtuple('Target', ['type', 'username', 'channel_id', 'topic_id', 'original_link'])
+
+# Immutable, deduplicated view of groups.txt shared by every stage
+TargetTable = namedtuple('TargetTable', ['targets', 'invalid', 'duplicates'])
+
+def parse_telegram_link(link):
+    """Enhanced Telegram link parsing with bot support"""
+    link = link.strip()
+    
+    # Try bot pattern first
+    bot_match = BOT_PATTERN.match(link)
+    if bot_match:
+        return Target('bot', bot_match.group(1), None, None, link)
+    
+    # Private links before topics, otherwise t.me/c/... parses as user "c"
+    private_match = PRIVATE_PATTERN.match(link)
     if private_match:
         channel_id = int(private_match.group(1))
         topic_id = int(private_match.group(2))
-        return {
-            'type': 'private_topic', 
-            'channel_id': channel_id,
-            'topic_id': topic_id,
-            'original_link': link
-        }
+        return Target('private_topic', None, channel_id, topic_id, link)
+    
+    # Try topic pattern
+    topic_match = TOPIC_PATTERN.match(link)
+    if topic_match:
+        topic_id = int(topic_match.group(2))
+        return Target('topic', topic_match.group(1), None, topic_id, link)
     
     # Try URL pattern
-    url_match = re.match(url_pattern, link)
+    url_match = URL_PATTERN.match(link)
     if url_match:
-        username = url_match.group(1)
-        return {
-            'type': 'username',
-            'username': username,
-            'original_link': link
-        }
+        return Target('username', url_match.group(1), None, None, link)
     
     # Try username pattern (without https)
-    username_match = re.match(username_pattern, link)
+    username_match = USERNAME_PATTERN.match(link)
     if username_match:
-        username = username_match.group(1)
-        return {
-            'type': 'username',
-            'username': username,
-            'original_link': link
-        }
+        return Target('username', username_match.group(1), None, None, link)
     
     return None
 
-async def resolve_entity(client, link_info):
-    """Enhanced entity resolution with bot support"""
+def target_identity(target):
+    """Key used to drop duplicate lines that point at the same target"""
+    username = target.username.lower() if target.username else None
+    return (target.type, username, target.channel_id, target.topic_id)
+
+def build_target_table(links, known=None):
+    """Parse groups.txt lines once into a deduplicated target table
+    
+    known maps lines from a previous table to their parsed target (None if
+    invalid) so a reload only parses new lines and reports new problems.
+    """
+    known = known or {}
+    targets = []
+    invalid = []
+    duplicates = []
+    seen = set()
+    
+    for line_no, link in enumerate(links, 1):
+        target = known[link] if link in known else parse_telegram_link(link)
+        if not target:
+            invalid.append((line_no, link))
+            continue
+        identity = target_identity(target)
+        if identity in seen:
+            duplicates.append((line_no, link))
+            continue
+        seen.add(identity)
+        targets.append(target)
+    
+    for line_no, link in invalid:
+        if link not in known:
+            emit(f"❌ groups.txt line {line_no}: invalid link {link} (skipped)", "red")
+    for line_no, link in duplicates:
+        if link not in known:
+            emit(f"⚠️ groups.txt line {line_no}: duplicate {link} (skipped)", "yellow", level=logging.WARNING)
+    
+    return TargetTable(tuple(targets), tuple(invalid), tuple(duplicates))
+
+target_table = TargetTable((), (), ())
+targets = ()
+
+def check_settings(values, where, allowed=Settings._fields):
+    """Raise ValueError for an unknown, mistyped or out-of-range setting"""
+    for name, value in values.items():
+        if name not in allowed:
+            raise ValueError(f"{where}: {name} can't be set here")
+        types, minimum, exclusive = SETTING_RULES[name]
+        # bool is an int subclass - don't let true/false pass as a number
+        if not isinstance(value, types) or (types is not bool and isinstance(value, bool)):
+            raise ValueError(f"{where}: {name} has the wrong type ({value!r})")
+        if minimum is not None and (value <= minimum if exclusive else value < minimum):
+            bound = "greater than" if exclusive else "at least"
+            raise ValueError(f"{where}: {name} must be {bound} {minimum}")
+        if name == 'log_level' and value.upper() not in LOG_LEVELS:
+            raise ValueError(f"{where}: log_level must be one of {', '.join(LOG_LEVELS)}")
+
+def normalize_settings(values):
+    """Turn validated values into their runtime form (level names -> numbers)"""
+    if 'log_level' in values:
+        values['log_level'] = LOG_LEVELS[values['log_level'].upper()]
+    return values
+
+def load_settings(path=config_path):
+    """Read bot_config.json into (Settings, {target identity: Settings})
+    
+    Missing keys (or a missing file) fall back to the defaults; keys bot.py
+    doesn't use are ignored. Anything malformed raises ValueError.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return DEFAULT_SETTINGS, {}
+    if not isinstance(data, dict):
+        raise ValueError("expected a JSON object")
+    
+    values = {name: data[name] for name in Settings._fields if name in data}
+    check_settings(values, "bot_config.json")
+    base = DEFAULT_SETTINGS._replace(**normalize_settings(values))
+    
+    overrides = {}
+    raw = data.get('target_overrides', {})
+    if not isinstance(raw, dict):
+        raise ValueError("target_overrides must map links to settings")
+    for link, values in raw.items():
+        target = parse_telegram_link(link)
+        if not target:
+            raise ValueError(f"target_overrides: invalid link {link}")
+        if not isinstance(values, dict):
+            raise ValueError(f"target_overrides[{link}]: expected an object")
+        check_settings(values, f"target_overrides[{link}]", TARGET_SETTINGS)
+        overrides[target_identity(target)] = base._replace(**normalize_settings(dict(values)))
+    return base, overrides
+
+def target_settings(target):
+    """Settings for one target - its override if it has one"""
+    return target_overrides.get(target_identity(target), settings)
+
+async def resolve_entity(client, link_info, session_name=None):
+    """Enhanced entity resolution with bot support and persistent caching"""
+    link_key = entity_cache_key(link_info)
+    if session_name:
+        cached = group_cache.get(session_name, link_key)
+        metrics.inc('entity_cache_total', result='hit' if cached else 'miss')
+        if cached:
+            if not cached['peer_type']:
+                return None
+            return EntityCache.to_input_peer(cached)
+
     try:
-        if link_info['type'] in ['bot', 'topic', 'username']:
+        entity = None
+        if link_info.type in ['bot', 'topic', 'username']:
             resolve_attempts = [
-                link_info['username'],
-                f"@{link_info['username']}",
-                f"https://t.me/{link_info['username']}"
+                link_info.username,
+                f"@{link_info.username}",
+                f"https://t.me/{link_info.username}"
             ]
             
             for attempt in resolve_attempts:
                 try:
-                    entity = await client.get_entity(attempt)
-                    return entity
+                    with metrics.timer(rpc='get_entity'):
+                        entity = await client.get_entity(attempt)
+                    break
                 except (ValueError, TypeError):
                     continue
             
             # Try as integer for private chats
-            try:
-                if link_info['username'].isdigit():
-                    entity = await client.get_entity(int(link_info['username']))
-                    return entity
-            except:
-                pass
+            if entity is None:
+                try:
+                    if link_info.username.isdigit():
+                        with metrics.timer(rpc='get_entity'):
+                            entity = await client.get_entity(int(link_info.username))
+                except RATE_LIMIT_ERRORS:
+                    raise
+                except Exception:
+                    pass
                 
-        elif link_info['type'] == 'private_topic':
-            entity = await client.get_entity(link_info['channel_id'])
-            return entity
+        elif link_info.type == 'private_topic':
+            try:
+                with metrics.timer(rpc='get_entity'):
+                    entity = await client.get_entity(link_info.channel_id)
+            except (ValueError, TypeError):
+                entity = None
+
+        if session_name:
+            if entity is not None:
+                group_cache.put(session_name, link_key, entity)
+            else:
+                group_cache.put_negative(session_name, link_key)
+        return entity
             
+    except RATE_LIMIT_ERRORS:
+        # Not the link's fault - let send_to_target pause the account
+        # instead of caching a negative entry or counting a failure
+        raise
+    except INVALIDATING_ERRORS as e:
+        if session_name:
+            group_cache.put_negative(session_name, link_key)
+        emit(f"❌ Failed to resolve {link_info.original_link}: {e}", "red", target=link_info)
+        return None
     except Exception as e:
-        print(colored(f"❌ Failed to resolve {link_info['original_link']}: {e}", "red"))
+        emit(f"❌ Failed to resolve {link_info.original_link}: {e}", "red", target=link_info)
         return None
 
-async def professional_forward_message(client, entity, message, topic_id=None):
+def dialog_keys(entity):
+    """Entity cache keys a dialog can satisfy: its usernames and c/<id>"""
+    keys = []
+    if getattr(entity, 'username', None):
+        keys.append(entity.username.lower())
+    for extra in getattr(entity, 'usernames', None) or ():
+        keys.append(extra.username.lower())
+    if isinstance(entity, Channel):
+        keys.append(f"c/{entity.id}")
+    return keys
+
+def unreachable_reason(entity):
+    """Why the account can't post to a dialog it is in, or None"""
+    if getattr(entity, 'broadcast', False) and not (entity.creator or entity.admin_rights):
+        return "Read-only channel (not an admin)"
+    return None
+
+async def warm_up(client, session_name, target_list=None):
+    """Resolve targets in bulk from one pass over the account's dialogs
+    
+    Dialog entities matching a target by username or channel id go straight
+    into the entity cache. Private links the account isn't a member of, and
+    channels it can't post to, are quarantined before the first send.
+    Returns (resolved, unreachable) counts.
+    """
+    target_list = targets if target_list is None else target_list
+    health = account_state(session_name).health
+    wanted = {}
+    for target in target_list:
+        record = health.get(target)
+        if record and record.quarantined:
+            continue
+        link_key = entity_cache_key(target)
+        if group_cache.get(session_name, link_key) is None:
+            wanted.setdefault(link_key, []).append(target)
+    if not wanted:
+        return 0, 0
+    
+    found = {}
+    blocked = {}
+    with metrics.timer(rpc='iter_dialogs'):
+        async for dialog in client.iter_dialogs():
+            entity = dialog.entity
+            for link_key in dialog_keys(entity):
+                if link_key in wanted:
+                    found[link_key] = entity
+                    reason = unreachable_reason(entity)
+                    if reason:
+                        blocked[link_key] = reason
+    group_cache.put_many(session_name, found.items())
+    
+    unreachable = 0
+    for link_key, link_targets in wanted.items():
+        reason = blocked.get(link_key)
+        if reason is None and link_key not in found and link_key.startswith('c/'):
+            # Private links only work for members, and members see the chat in dialogs
+            reason = "Not a member of this private chat"
+        if reason:
+            for target in link_targets:
+                health.record_failure(target, reason, PERMANENT)
+                unreachable += 1
+    return len(found), unreachable
+
+def input_media(message):
+    """Input media reference built from the message's own (freshest) file reference
+
+    Photos and documents go out by id, never re-uploaded; web pages and
+    other media pass through unchanged.
+    """
+    media = message.media
+    if isinstance(media, MessageMediaPhoto) and media.photo:
+        return utils.get_input_media(media)
+    if isinstance(media, MessageMediaDocument) and media.document:
+        return utils.get_input_media(media)
+    return media
+
+async def refresh_media(client, message):
+    """Fetch the message again for a fresh file reference and rebuild its media"""
+    with metrics.timer(rpc='get_messages'):
+        fresh = await client.get_messages(message.chat_id, ids=message.id)
+    if fresh is None or not fresh.media:
+        raise ValueError("original media no longer available")
+    message.media = fresh.media
+    return input_media(message)
+
+async def send_copy(client, entity, message, topic_id=None, options=None):
+    """Send a message as a copy, reusing its media by reference"""
+    options = options or settings
+    file = input_media(message) if message.media else None
+    for attempt in range(2):
+        try:
+            with metrics.timer(rpc='send_message'):
+                return await client.send_message(
+                    entity=entity,
+                    message=message.text or "📢 Forwarded Message",
+                    file=file,
+                    reply_to=topic_id,
+                    silent=options.enable_silent_mode
+                )
+        except FileReferenceExpiredError:
+            if attempt:
+                raise
+            file = await refresh_media(client, message)
+
+async def professional_forward_message(client, entity, message, topic_id=None, options=None):
     """
     PROFESSIONAL FORWARDING: Use the most reliable forwarding method
     Returns: (success, error_message)
     """
+    options = options or settings
     try:
-        # Method 1: Try direct forward_messages (most reliable)
+        # Method 1: Try a native forward (most reliable)
         if topic_id:
-            # For topics, we need to use send_message with reply_to
-            if message.media:
-                await client.send_message(
-                    entity=entity,
-                    message=message.text or "📢 Forwarded Message",
-                    file=message.media,
-                    reply_to=topic_id
-                )
-            else:
-                await client.send_message(
-                    entity=entity,
-                    message=message.text or "📢 Forwarded Message",
-                    reply_to=topic_id
-                )
+            # forward_messages can't target a topic - the raw request can
+            with metrics.timer(rpc='forward_messages'):
+                await client(ForwardMessagesRequest(
+                    from_peer=await message.get_input_chat(),
+                    id=[message.id],
+                    to_peer=await client.get_input_entity(entity),
+                    top_msg_id=topic_id,
+                    silent=options.enable_silent_mode,
+                    drop_author=options.enable_drop_author
+                ))
         else:
             # Standard forwarding for regular chats
-            await client.forward_messages(
-                entity=entity,
-                messages=message
-            )
+            with metrics.timer(rpc='forward_messages'):
+                await client.forward_messages(
+                    entity=entity,
+                    messages=message,
+                    silent=options.enable_silent_mode,
+                    drop_author=options.enable_drop_author
+                )
         return True, None
         
     except Exception as e:
+        # A copy can't get past bans, closed topics or flood waits -
+        # only transient forward errors are worth a second round-trip
+        if classify_error(e) != TRANSIENT:
+            raise
         error_msg = str(e)
         
         # Method 2: If forwarding fails, try sending as copy
         try:
-            if topic_id:
-                if message.media:
-                    await client.send_message(
-                        entity=entity,
-                        message=message.text or "📢 Forwarded Message",
-                        file=message.media,
-                        reply_to=topic_id
-                    )
-                else:
-                    await client.send_message(
-                        entity=entity,
-                        message=message.text or "📢 Forwarded Message", 
-                        reply_to=topic_id
-                    )
-            else:
-                await client.send_message(
-                    entity=entity,
-                    message=message.text or "📢 Forwarded Message",
-                    file=message.media if message.media else None
-                )
+            await send_copy(client, entity, message, topic_id, options)
             return True, "Sent as copy (fallback)"
         except Exception as copy_error:
+            if classify_error(copy_error) != TRANSIENT:
+                raise
             return False, f"Forward: {error_msg[:30]}, Copy: {str(copy_error)[:30]}"
 
-async def send_to_target(client, link_info, message, session_name):
-    """PERFECT FORWARDING: Advanced forwarding with multiple fallbacks"""
+def group_batch(messages):
+    """Split messages into per-source-chat units, keeping albums together
+
+    Returns {chat_id: [[message, ...], ...]} where each inner list is a
+    single message or a whole album, in the order they were sent.
+    """
+    groups = {}
+    for message in sorted(messages, key=lambda m: (m.chat_id, m.id)):
+        units = groups.setdefault(message.chat_id, [])
+        grouped_id = getattr(message, 'grouped_id', None)
+        if grouped_id and units and getattr(units[-1][0], 'grouped_id', None) == grouped_id:
+            units[-1].append(message)
+        else:
+            units.append([message])
+    return groups
+
+def chunk_units(units, limit=MAX_FORWARD_BATCH):
+    """Pack units into chunks of at most `limit` ids without splitting albums"""
+    chunk = []
+    for unit in units:
+        if chunk and len(chunk) + len(unit) > limit:
+            yield chunk
+            chunk = []
+        chunk.extend(unit)
+    if chunk:
+        yield chunk
+
+async def copy_album(client, entity, album, topic_id=None, options=None):
+    """Re-send an album as a copy so its items stay grouped"""
+    options = options or settings
+    files = [input_media(message) for message in album]
+    for attempt in range(2):
+        try:
+            with metrics.timer(rpc='send_file'):
+                return await client.send_file(
+                    entity,
+                    files,
+                    caption=[message.text or "" for message in album],
+                    reply_to=topic_id,
+                    silent=options.enable_silent_mode
+                )
+        except FileReferenceExpiredError:
+            if attempt:
+                raise
+            files = [await refresh_media(client, message) for message in album]
+
+async def professional_forward_batch(client, entity, messages, topic_id=None, options=None,
+                                     on_delivered=None):
+    """
+    BATCHED FORWARDING: one ForwardMessagesRequest per source chat
+    Falls back to per-message forwarding/copy only for chunks that fail.
+    `on_delivered` is called after every chunk that goes out, so a batch
+    cut short by a flood wait or shutdown keeps what it already sent.
+    Returns: (delivered_messages, status_message)
+    """
+    options = options or settings
+    to_peer = await client.get_input_entity(entity)
+    delivered = []
+    copied = 0
+    failures = []
+    
+    for units in group_batch(messages).values():
+        from_peer = await units[0][0].get_input_chat()
+        for chunk in chunk_units(units):
+            try:
+                with metrics.timer(rpc='forward_batch'):
+                    await client(ForwardMessagesRequest(
+                        from_peer=from_peer,
+                        id=[message.id for message in chunk],
+                        to_peer=to_peer,
+                        top_msg_id=topic_id,
+                        silent=options.enable_silent_mode,
+                        drop_author=options.enable_drop_author
+                    ))
+                delivered.extend(chunk)
+                if on_delivered:
+                    on_delivered(chunk)
+                continue
+            except Exception as e:
+                if classify_error(e) != TRANSIENT:
+                    raise
+                error_msg = str(e)
+            
+            # Only the failed chunk falls back, one unit at a time
+            chunk_ids = {message.id for message in chunk}
+            for unit in units:
+                if unit[0].id not in chunk_ids:
+                    continue
+                try:
+                    if len(unit) > 1 and all(message.media for message in unit):
+                        await copy_album(client, entity, unit, topic_id, options)
+                        delivered.extend(unit)
+                        copied += len(unit)
+                        if on_delivered:
+                            on_delivered(unit)
+                        continue
+                    for message in unit:
+                        success, error_info = await professional_forward_message(client, entity, message, topic_id, options)
+                        if success:
+                            delivered.append(message)
+                            copied += 1
+                            if on_delivered:
+                                on_delivered([message])
+                        else:
+                            failures.append(error_info)
+                except Exception as unit_error:
+                    if classify_error(unit_error) != TRANSIENT:
+                        raise
+                    failures.append(f"Batch: {error_msg[:30]}, Copy: {str(unit_error)[:30]}")
+    
+    if not delivered:
+        return [], failures[0] if failures else "Nothing delivered"
+    status = f"📦 Batched {len(delivered)}/{len(messages)} messages"
+    if copied:
+        status += f" ({copied} via fallback)"
+    metrics.inc('batched_messages_total', len(delivered))
+    return delivered, status
+
+def cooldown_key(entity_id, link_info):
+    """Key used in last_sent_times (topics cool down separately)"""
+    if link_info.type in ['topic', 'private_topic']:
+        return f"{entity_id}_{link_info.topic_id}"
+    return str(entity_id)
+
+def cached_cooldown_key(link_info, session_name):
+    """Cooldown key from the entity cache, or None if not resolved yet"""
+    entry = group_cache.get(session_name, entity_cache_key(link_info))
+    if not entry or not entry['peer_type']:
+        return None
+    return cooldown_key(entry['peer_id'], link_info)
+
+async def send_to_target(client, link_info, message, session_name, on_delivered=None):
+    """PERFECT FORWARDING: Advanced forwarding with multiple fallbacks
+
+    `message` may be a single message or a list to deliver as one batch.
+    `on_delivered` gets the messages that actually went out - for a batch
+    once per chunk, so partial progress survives a later failure.
+    """
     now = time.time()
+    target_name = link_info.original_link
+    entity_id = None
+    health = account_state(session_name).health
+    
+    # Quarantined targets are skipped without any RPC
+    record = health.get(link_info)
+    if record and record.quarantined and now < record.retry_at:
+        metrics.inc('sends_total', account=session_name, outcome='quarantined')
+        return False, target_name, f"🚫 Quarantined: {record.reason}"
+    
+    # A flood-waited account must not resolve usernames either
+    limiter = account_state(session_name).limiter
+    if limiter.is_paused(now):
+        metrics.inc('sends_total', account=session_name, outcome='paused')
+        return False, target_name, f"⏳ Account paused for {int(limiter.paused_until - now)}s (flood wait)"
     
     try:
-        # Resolve entity first
-        entity = await resolve_entity(client, link_info)
+        # Resolve entity first (served from the entity cache when possible)
+        entity = await resolve_entity(client, link_info, session_name)
         if not entity:
-            return False, link_info['original_link'], "❌ Cannot resolve entity"
+            health.record_failure(link_info, "Cannot resolve entity", TRANSIENT)
+            metrics.inc('sends_total', account=session_name, outcome='unresolved')
+            return False, link_info.original_link, "❌ Cannot resolve entity"
         
         # Get entity name for display
-        entity_name = getattr(entity, 'title', getattr(entity, 'username', link_info['original_link']))
+        entity_name = entity_display_name(entity, link_info, session_name)
+        entity_id = utils.get_peer_id(entity, add_mark=False)
         
         # Create unique key for cooldown tracking
-        if link_info['type'] in ['topic', 'private_topic']:
-            entity_key = f"{entity.id}_{link_info['topic_id']}"
-            target_name = f"{entity_name} (Topic {link_info['topic_id']})"
-            topic_id = link_info['topic_id']
+        entity_key = cooldown_key(entity_id, link_info)
+        if link_info.type in ['topic', 'private_topic']:
+            target_name = f"{entity_name} (Topic {link_info.topic_id})"
+            topic_id = link_info.topic_id
         else:
-            entity_key = str(entity.id)
             target_name = entity_name
             topic_id = None
         
-        # Check cooldown (1 hour)
+        # Check cooldown
+        options = target_settings(link_info)
+        last_sent_times = account_state(session_name).last_sent_times
         last_sent = last_sent_times.get(entity_key, 0)
-        if now - last_sent < 3600:
-            wait_time = 3600 - (now - last_sent)
+        if now - last_sent < options.cooldown_period:
+            wait_time = options.cooldown_period - (now - last_sent)
+            metrics.inc('sends_total', account=session_name, outcome='cooldown')
             return False, target_name, f"⏰ {int(wait_time/60)}min cooldown"
         
-        # Smart delay based on previous performance
-        delay = 3 if sent_counters.get(session_name, 0) > 10 else 5
-        print(colored(f"⏳ Waiting {delay} seconds before forwarding to {target_name}...", "yellow"))
-        await asyncio.sleep(delay)
+        # Adaptive pacing per account and per destination chat
+        delay = await limiter.acquire(entity_id)
+        if delay >= 0.5:
+            emit(f"⏳ Waited {delay:.1f} seconds before forwarding to {target_name}", "yellow",
+                 target=link_info, sample='pacing')
         
-        # PROFESSIONAL FORWARDING with multiple fallbacks
-        success, error_info = await professional_forward_message(client, entity, message, topic_id)
+        # PROFESSIONAL FORWARDING with multiple fallbacks (a list is sent as one batch)
+        if isinstance(message, list):
+            delivered, error_info = await professional_forward_batch(client, entity, message, topic_id, options,
+                                                                     on_delivered)
+            success = bool(delivered)
+        else:
+            success, error_info = await professional_forward_message(client, entity, message, topic_id, options)
+            if success and on_delivered:
+                on_delivered([message])
         
         if success:
-            last_sent_times[entity_key] = now
+            limiter.on_success()
+            health.record_success(link_info)
+            # Stamped after the send, so every checkpointed chunk predates it
+            sent_at = time.time()
+            last_sent_times[entity_key] = sent_at
+            state_store.set_cooldown(session_name, entity_key, sent_at)
             status_msg = error_info if error_info else "✅ Perfect forward"
+            # Both single and batched sends mention "fallback" when a copy was needed
+            outcome = 'copy_fallback' if error_info and 'fallback' in error_info else 'success'
+            metrics.inc('sends_total', account=session_name, outcome=outcome)
             return True, target_name, status_msg
         else:
+            health.record_failure(link_info, error_info, TRANSIENT)
+            metrics.inc('sends_total', account=session_name, outcome='transient_error')
             return False, target_name, f"❌ {error_info}"
             
     except FloodWaitError as e:
-        return False, target_name, f"⏳ Flood wait: {e.seconds}s"
-    except ChatWriteForbiddenError:
-        return False, target_name, "❌ No write permission"
-    except UserBannedInChannelError:
-        return False, target_name, "❌ User banned"
+        # Pause the whole account; the scheduler requeues the job for when it ends
+        account_state(session_name).limiter.on_flood_wait(e.seconds)
+        metrics.inc('sends_total', account=session_name, outcome='flood_wait')
+        metrics.inc('flood_wait_seconds_total', e.seconds, account=session_name)
+        return False, target_name, f"⏳ Flood wait: {e.seconds}s (account paused)"
+    except SlowModeWaitError as e:
+        if entity_id is not None:
+            account_state(session_name).limiter.on_slow_mode(entity_id, e.seconds)
+        health.defer(link_info, e.seconds)
+        metrics.inc('sends_total', account=session_name, outcome='slow_mode')
+        return False, target_name, f"⏳ Slow mode: {e.seconds}s"
     except Exception as e:
-        error_msg = str(e)
-        return False, target_name, f"❌ {error_msg[:40]}"
+        if isinstance(e, INVALIDATING_ERRORS):
+            # The cached peer is dead - resolve it from scratch next time
+            group_cache.invalidate(session_name, entity_cache_key(link_info))
+        reason = describe_error(e)
+        outcome = classify_error(e)
+        health.record_failure(link_info, reason, outcome)
+        metrics.inc('sends_total', account=session_name, outcome=f"{outcome}_error")
+        return False, target_name, f"❌ {reason}"
+
+def emit_failure(target_name, status, target):
+    """Log a failed send - cooldown skips are routine, so they are sampled"""
+    if status.startswith("⏰"):
+        emit(f"⏰ {target_name}: {status}", "yellow", target=target, sample='cooldown')
+    else:
+        emit(f"❌ {target_name}: {status}", "red", target=target)
+
+MEDIA_LABELS = {
+    'photo': "🖼️ Photo message",
+    'video': "🎥 Video message",
+    'sticker': "😀 Sticker message",
+    'document': "📄 Document message",
+}
+
+def describe_message(message):
+    """Short one-line preview of a stored message"""
+    if message.text:
+        return message.text[:50] + "..." if len(message.text) > 50 else message.text
+    if message.media is None:
+        return f"(saved message {message.message_id})"
+    return MEDIA_LABELS.get(message.media.kind, "📎 Media message")
 
-async def forward_to_all_groups(client, message, session_name, message_id=None):
-    """Enhanced forwarding with better progress tracking"""
-    global last_terminal_clear, is_forwarding
+async def handle_store_command(event, state):
+    """Admin commands: /messages, /delete <n|key> and /health"""
+    latest_messages = state.latest_messages
+    text = (event.message.text or "").strip()
+    if text == "/messages":
+        if not len(latest_messages):
+            await event.reply("📭 No stored messages")
+            return True
+        lines = [f"📊 Stored messages ({len(latest_messages)}/{latest_messages.max_entries}):"]
+        for i, message_key in enumerate(latest_messages.by_stored_at(), 1):
+            message = latest_messages[message_key]
+            age = int((time.time() - latest_messages.stored_at[message_key]) / 3600)
+            lines.append(f"{i}. {message_key} - {age}h old - {describe_message(message)}")
+        await event.reply("\n".join(lines))
+        return True
     
-    if is_forwarding:
-        print(colored("🔄 Forwarding already in progress. Please wait...", "yellow"))
-        return 0
+    if text == "/health":
+        quarantined = state.health.quarantined()
+        if not quarantined:
+            await event.reply("✅ No quarantined targets")
+            return True
+        lines = [f"🚫 Quarantined targets ({len(quarantined)}):"]
+        for key, record in quarantined:
+            until = time.strftime('%d %b %H:%M', time.localtime(record.retry_at))
+            lines.append(f"• {key}: {record.reason} (until {until})")
+        await event.reply("\n".join(lines))
+        return True
     
-    is_forwarding = True
+    if text.startswith("/delete"):
+        parts = text.split(maxsplit=1)
+        if len(parts) < 2:
+            await event.reply("Usage: /delete <number|message key>")
+            return True
+        selector = parts[1].strip()
+        message_key = selector
+        if selector.isdigit():
+            # Same numbering as /messages
+            keys = latest_messages.by_stored_at()
+            index = int(selector) - 1
+            message_key = keys[index] if 0 <= index < len(keys) else None
+        if message_key and latest_messages.remove(message_key):
+            await event.reply(f"🗑️ Deleted {message_key}")
+        else:
+            await event.reply(f"❌ No stored message {selector}")
+        return True
     
-    try:
-        # Clear terminal every hour to prevent spammy logs
-        current_time = time.time()
-        if current_time - last_terminal_clear >= 3600:
-            clear_terminal()
-            last_terminal_clear = current_time
-            print(colored("🧹 Terminal cleared to prevent spammy logs", "blue"))
-        
-        print(colored("🚀 PERFECT TELEGRAM FORWARDER", "green", attrs=['bold']))
-        print(colored(f"📤 FORWARDING to {len(target_links)} targets...", "cyan"))
-        print(colored("🔄 PROFESSIONAL FORWARDING WITH FALLBACKS", "magenta", attrs=['bold']))
-        print(colored("⏰ Smart delays | 1-hour cooldown per target", "yellow"))
-        print(colored("🎯 Bot support & enhanced error handling", "blue"))
-        print(colored("⏳ 1-hour gap after completing all groups", "cyan"))
-        print(colored("=" * 60, "white"))
-        
-        sent_count = 0
-        total_sent = sent_counters.get(session_name, 0)
-        successful_targets = []
-        failed_targets = []
-        
-        for i, link in enumerate(target_links, 1):
-            print(colored(f"\n📋 Processing {i}/{len(target_links)}: {link}", "blue"))
-            
-            # Parse the link with enhanced parsing
-            link_info = parse_telegram_link(link)
-            if not link_info:
-                print(colored("❌ Invalid link format - skipping", "red"))
-                failed_targets.append((link, "Invalid format"))
-                continue
-            
-            # Send to target
-            success, target_name, status = await send_to_target(client, link_info, message, session_name)
-            
-            if success:
-                print(colored(f"✅ {target_name}: {status}", "green"))
-                sent_count += 1
-                total_sent += 1
-                successful_targets.append(target_name)
-            else:
-                print(colored(f"❌ {target_name}: {status}", "red"))
-                failed_targets.append((target_name, status))
-        
-        # Update counters
-        if sent_count > 0:
-            sent_counters[session_name] = total_sent
-        
-        # Display final results
-        print(colored("\n" + "=" * 60, "white"))
-        print(colored("📊 PERFECT FORWARDING SUMMARY", "cyan", attrs=['bold']))
-        print(colored(f"✅ Successfully FORWARDED: {sent_count}/{len(target_links)}", "green"))
-        print(colored(f"📈 Total forwards this session: {total_sent}", "blue"))
-        print(colored(f"❌ Failed: {len(failed_targets)} targets", "yellow" if failed_targets else "green"))
-        
-        if successful_targets:
-            print(colored(f"🎯 Forwarded to: {', '.join(successful_targets[:5])}", "cyan"))
-            if len(successful_targets) > 5:
-                print(colored(f"   ... and {len(successful_targets) - 5} more", "cyan"))
-        
-        if failed_targets:
-            print(colored(f"\n🔧 Failed targets (first 5):", "yellow"))
-            for target, error in failed_targets[:5]:
-                print(colored(f"   • {target}: {error}", "yellow"))
-        
-        return sent_count
-        
-    finally:
-        is_forwarding = False
+    return False
 
 async def handle_admin_messages(client, admin_ids, session_name):
     """Enhanced admin message handler with better storage"""
+    state = account_state(session_name)
+    state.admin_ids = set(admin_ids)
+    
     @client.on(events.NewMessage)
     async def handler(event):
-        if event.sender_id not in admin_ids:
+        # Read from the state so acc.json edits apply without reconnecting
+        if event.sender_id not in state.admin_ids:
+            return
+        if lifecycle.stopping.is_set():
+            # Intake is closed while shutting down
+            return
+        
+        # Store management commands are never forwarded
+        if await handle_store_command(event, state):
             return
 
         # Generate unique message ID with timestamp
         message_id = f"{event.chat_id}_{event.message.id}_{int(time.time())}"
         
-        # Store the message in latest_messages dict
-        latest_messages[message_id] = event.message
-        
-        # Add to message queue
-        message_queue.append(message_id)
+        # Store the message (older ones are evicted past the store limits)
+        stored = StoredMessage.from_message(event.message)
+        state.latest_messages.add(message_id, stored)
+        # The event's message is fresh, so the first deliveries need no fetch
+        state.live_messages[message_id] = (event.message, time.time())
+        state_store.add_message(session_name, message_id, stored)
+        state.scheduler.wakeup.set()
         
-        # Show professional preview
-        clear_terminal()
-        print(colored("📨 NEW MESSAGE RECEIVED FOR PERFECT FORWARDING", "green", attrs=['bold']))
-        
-        # Enhanced message preview
-        if event.message.text:
-            preview = event.message.text[:100] + "..." if len(event.message.text) > 100 else event.message.text
-            print(colored(f"💬 Text: {preview}", "cyan"))
-        else:
-            if event.message.photo:
-                media_type = "🖼️ Photo"
-            elif event.message.video:
-                media_type = "🎥 Video" 
-            elif event.message.document:
-                media_type = "📄 Document"
-            elif event.message.sticker:
-                media_type = "😀 Sticker"
+        # Acknowledge only - delivery workers pick it up from the scheduler
+        emit("📨 NEW MESSAGE QUEUED FOR PERFECT FORWARDING", "green", attrs=['bold'])
+        emit(f"💬 {describe_message(stored)}", "cyan")
+        emit(f"📊 Total stored messages: {len(state.latest_messages)} | "
+             f"{len(state.scheduler)} targets scheduled", "blue")
+
+class DeliveryScheduler:
+    """Priority queue of (due time, target) jobs driven by per-target cooldowns
+
+    Each target holds exactly one job. When it comes due the target gets the
+    stored message it has gone longest without, and is rescheduled for the
+    moment its cooldown expires.
+    """
+
+    def __init__(self, state):
+        self.state = state
+        self.session_name = state.session_name
+        self.heap = []
+        self.due = {}
+        self.active = set()
+        self.wanted = set()
+        self.sent_log = {}
+        self.counter = itertools.count()
+        self.wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self.due)
+
+    def schedule(self, target, due):
+        """(Re)schedule a target; older heap entries for it become stale"""
+        identity = target_identity(target)
+        self.due[identity] = due
+        heapq.heappush(self.heap, (due, next(self.counter), target))
+        self.wakeup.set()
+
+    def cancel(self, target):
+        self.due.pop(target_identity(target), None)
+
+    def sync_targets(self, target_list):
+        """Schedule new targets when their cooldown or backoff ends and drop removed ones"""
+        wanted = {target_identity(target): target for target in target_list}
+        self.wanted = set(wanted)
+        for identity in list(self.due):
+            if identity not in wanted:
+                del self.due[identity]
+                if self.sent_log.pop(identity_key(identity), None) is not None:
+                    state_store.clear_deliveries(self.session_name, identity_key(identity))
+        for identity, target in wanted.items():
+            if identity not in self.due and identity not in self.active:
+                due = max(self.cooldown_due(target), self.state.health.retry_at(target))
+                self.schedule(target, due)
+
+    def cooldown_due(self, target):
+        """When the target's cooldown expires (0 if unknown or not sent yet)"""
+        key = cached_cooldown_key(target, self.session_name)
+        if key is None:
+            return 0
+        return self.state.last_sent_times.get(key, 0) + target_settings(target).cooldown_period
+
+    def next_due(self, target, now=None):
+        """Cooldown expiry if still ahead, the end of a flood wait, or retry later"""
+        now = now or time.time()
+        due = self.cooldown_due(target)
+        if due > now:
+            return due
+        if self.state.limiter.is_paused(now):
+            # Requeue flood-waited jobs for the moment the pause ends
+            return self.state.limiter.paused_until
+        retry_at = self.state.health.retry_at(target)
+        if retry_at > now:
+            # Failing and quarantined targets wait out their backoff
+            return retry_at
+        return now + target_settings(target).cooldown_period
+
+    def peek(self):
+        """Earliest live job as (due, target), discarding stale entries"""
+        while self.heap:
+            due, _, target = self.heap[0]
+            if self.due.get(target_identity(target)) == due:
+                return due, target
+            heapq.heappop(self.heap)
+        return None
+
+    async def next_job(self):
+        """Wait until a job is due and there is something to send"""
+        while True:
+            self.wakeup.clear()
+            job = self.peek() if len(self.state.latest_messages) else None
+            if job is None:
+                await self.wakeup.wait()
+                continue
+            due, target = job
+            delay = due - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self.heap)
+            identity = target_identity(target)
+            del self.due[identity]
+            self.active.add(identity)
+            return target
+
+    def release(self, target, due):
+        """Hand an in-flight target back, unless it was removed meanwhile"""
+        identity = target_identity(target)
+        self.active.discard(identity)
+        if identity in self.wanted:
+            self.schedule(target, due)
+
+    def pick_message(self, target):
+        """Stored message this target has gone longest without"""
+        sent = self.sent_log.setdefault(target_key(target), {})
+        latest_messages = self.state.latest_messages
+        for message_key in list(sent):
+            if message_key not in latest_messages:
+                del sent[message_key]
+        best_key = None
+        best_time = None
+        for message_key in latest_messages.keys():
+            last = sent.get(message_key, 0)
+            if best_time is None or last < best_time:
+                best_key, best_time = message_key, last
+        return best_key
+
+    def pick_messages(self, target):
+        """Keys to deliver on this job: every stored message in batch mode
+
+        Messages delivered after the last completed send, within the
+        cooldown window, are left out so a batch cut short (or a restart)
+        doesn't send them twice.
+        """
+        if BATCH_DELIVERY:
+            latest_messages = self.state.latest_messages
+            sent = self.sent_log.get(target_key(target), {})
+            cooldown = cached_cooldown_key(target, self.session_name)
+            since = max(self.state.last_sent_times.get(cooldown, 0) if cooldown else 0,
+                        time.time() - target_settings(target).cooldown_period)
+            keys = [key for key in latest_messages.keys() if sent.get(key, 0) <= since]
+            return sorted(keys, key=latest_messages.stored_at.get)
+        message_key = self.pick_message(target)
+        return [message_key] if message_key else []
+
+    def record_sent(self, target, message_key, sent_at):
+        """Checkpoint a delivery so a restarted run doesn't repeat it"""
+        key = target_key(target)
+        self.sent_log.setdefault(key, {})[message_key] = sent_at
+        state_store.record_delivery(self.session_name, key, message_key, sent_at)
+
+async def delivery_worker(client, state, worker_id):
+    """Drain due jobs from the scheduler one target at a time"""
+    session_name = state.session_name
+    scheduler = state.scheduler
+    latest_messages = state.latest_messages
+    limiter = state.limiter
+    while True:
+        target = await scheduler.next_job()
+        # Until something is sent the job can simply be retried; the finally
+        # block hands the target back however the job ends, even if cancelled
+        due = time.time()
+        live = messages = payload = None
+        try:
+            if lifecycle.stopping.is_set():
+                # Shutting down - leave the job for the next run
+                return
+            job_started = time.perf_counter()
+            latest_messages.evict()
+            message_keys = scheduler.pick_messages(target)
+            if not message_keys:
+                # Everything was delivered this cooldown window - come back when it ends
+                due = scheduler.next_due(target)
+                continue
+            if limiter.is_paused():
+                # A flood-waited account must not fetch messages either
+                due = limiter.paused_until
+                continue
+            try:
+                live = await rehydrate(client, state, message_keys)
+            except RATE_LIMIT_ERRORS as e:
+                # Pause the account like a send would and requeue for when it ends
+                limiter.on_flood_wait(e.seconds)
+                metrics.inc('flood_wait_seconds_total', e.seconds, account=session_name)
+                due = limiter.paused_until
+                continue
+            except Exception as e:
+                emit(f"❌ Could not load stored messages: {e}", "red")
+                due = time.time() + target_settings(target).cooldown_period
+                continue
+            messages = list(live.items())
+            if not messages:
+                # Messages vanished while waiting - try again straight away
+                continue
+            
+            emit(f"\n📨 [W{worker_id}] {len(messages)}/{len(latest_messages)} message(s) → {target.original_link}", "yellow",
+                 level=logging.DEBUG, target=target)
+            payload = [message for _, message in messages] if BATCH_DELIVERY else messages[0][1]
+            keys_by_message = {(message.chat_id, message.id): message_key
+                               for message_key, message in messages}
+            
+            def on_delivered(delivered):
+                # Checkpoint each chunk as soon as it is out
+                sent_at = time.time()
+                for message in delivered:
+                    message_key = keys_by_message[message.chat_id, message.id]
+                    scheduler.record_sent(target, message_key, sent_at)
+                sent_counters[session_name] = sent_counters.get(session_name, 0) + len(delivered)
+                state_store.set_counter(session_name, sent_counters[session_name])
+            
+            record = state.health.get(target)
+            was_quarantined = bool(record and record.quarantined)
+            try:
+                success, target_name, status = await send_to_target(client, target, payload, session_name,
+                                                                    on_delivered)
+            finally:
+                # Once a send was attempted the cooldown and backoff decide
+                due = scheduler.next_due(target)
+                metrics.observe('job_duration_seconds', time.perf_counter() - job_started,
+                                account=session_name)
+            
+            if success:
+                emit(f"✅ {target_name}: {status}", "green", target=target)
             else:
-                media_type = "📎 Media"
-            print(colored(f"{media_type} message", "cyan"))
-        
-        print(colored(f"📊 Total stored messages: {len(latest_messages)}", "blue"))
-        print(colored("🔄 PERFECT FORWARDING MODE ACTIVATED", "magenta", attrs=['bold']))
-        print(colored("⏰ Smart delays | 1-hour gap after completion", "yellow"))
-        print(colored("🎯 Bot support & enhanced error handling", "blue"))
-        print(colored("=" * 60, "white"))
-        await asyncio.sleep(2)
-        
-        # Start forwarding this specific message
-        sent_count = await forward_to_all_groups(client, event.message, session_name, message_id)
-        
-        # Always wait 1 hour after forwarding (regardless of sent_count)
-        if sent_count > 0:
-            print(colored(f"\n⏳ Waiting 1 hour before next forwarding cycle...", "blue", attrs=['bold']))
-            print(colored(f"💤 Next cycle at: {time.strftime('%H:%M:%S', time.localtime(time.time() + 3600))}", "cyan"))
-            await asyncio.sleep(3600)
-
-async def auto_forwarder(client, session_name):
-    """Enhanced auto-forwarder with better message management"""
+                emit_failure(target_name, status, target)
+                record = state.health.get(target)
+                if record and record.quarantined and not was_quarantined:
+                    print_health_summary(session_name)
+            emit(f"💤 Next send to {target_name} at: {time.strftime('%H:%M:%S', time.localtime(due))}", "cyan",
+                 target=target, sample='next_send')
+        finally:
+            scheduler.release(target, due)
+            # Don't hold Message objects while waiting for the next job
+            live = messages = payload = None
+            state.release_live_messages()
+
+async def auto_forwarder(client, session_name, workers=DELIVERY_WORKERS):
+    """Scheduled forwarder: a pool of workers serves each target when its cooldown expires"""
+    state = account_state(session_name)
+    scheduler = state.scheduler
+    scheduler.sync_targets(targets)
+    emit(f"🗓️ Scheduler started with {len(scheduler)} targets, {workers} worker(s)", "blue")
+    
+    await asyncio.gather(*(
+        delivery_worker(client, state, worker_id)
+        for worker_id in range(1, workers + 1)
+    ))
+
+def update_gauges():
+    """Refresh queue depth, store size and pacing gauges for every account"""
+    now = time.time()
+    for session_name, state in account_states.items():
+        scheduler = state.scheduler
+        ready = sum(1 for due in scheduler.due.values() if due <= now)
+        metrics.set_gauge('scheduled_targets', len(scheduler), account=session_name)
+        metrics.set_gauge('queue_depth', ready if len(state.latest_messages) else 0,
+                          account=session_name)
+        metrics.set_gauge('stored_messages', len(state.latest_messages), account=session_name)
+        metrics.set_gauge('send_interval_seconds', round(state.limiter.interval, 3),
+                          account=session_name)
+        metrics.set_gauge('quarantined_targets', len(state.health.quarantined()),
+                          account=session_name)
+
+def print_metrics_summary(rates):
+    """Optional console sink: one line per account"""
+    for session_name, rate in rates.items():
+        ok = metrics.counter_total('sends_total', account=session_name, outcome='success')
+        copies = metrics.counter_total('sends_total', account=session_name, outcome='copy_fallback')
+        floods = metrics.counter_total('sends_total', account=session_name, outcome='flood_wait')
+        emit(f"📈 {session_name}: {rate:.1f} sends/min | ✅ {ok} | 📋 {copies} copies | "
+             f"🛑 {floods} flood waits", "blue")
+
+async def metrics_exporter(path=metrics_path, interval=METRICS_INTERVAL, console=METRICS_CONSOLE):
+    """Append a metrics snapshot to a JSON lines file every interval"""
+    previous = {}
+    while True:
+        await asyncio.sleep(interval)
+        rates = {}
+        for session_name in account_states:
+            sent = (metrics.counter_total('sends_total', account=session_name, outcome='success')
+                    + metrics.counter_total('sends_total', account=session_name, outcome='copy_fallback'))
+            rates[session_name] = (sent - previous.get(session_name, sent)) * 60 / interval
+            previous[session_name] = sent
+            metrics.set_gauge('send_rate_per_minute', round(rates[session_name], 3),
+                              account=session_name)
+        update_gauges()
+        try:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(metrics.snapshot()) + "\n")
+        except OSError as e:
+            emit(f"❌ Unable to write metrics: {e}", "red")
+        if console:
+            print_metrics_summary(rates)
+
+async def serve_metrics(host=METRICS_HOST, port=METRICS_PORT):
+    """Serve the metrics in Prometheus text format on a local port"""
+    async def handle(reader, writer):
+        try:
+            await reader.readline()
+            update_gauges()
+            body = metrics.render_prometheus().encode()
+            writer.write(b"HTTP/1.0 200 OK\r\n"
+                         b"Content-Type: text/plain; version=0.0.4\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    emit(f"📊 Metrics at http://{host}:{port}/metrics", "blue")
+    return server
+
+async def run_account(account):
+    """Keep one account connected, restarting it with backoff if it fails"""
+    api_id = account["api_id"]
+    api_hash = account["api_hash"]
+    phone_number = account["phone_number"]
+    session_name = account["session_name"]
+    admin_ids = account.get("admin_ids", [])
+    
+    if not admin_ids:
+        emit(f"❌ No admin_ids for {phone_number}", "red")
+        return
+    
+    backoff = RESTART_BACKOFF_MIN
     while True:
-        if latest_messages:
-            clear_terminal()
-            print(colored("🔄 PERFECT AUTOMATIC HOURLY FORWARDING", "blue", attrs=['bold']))
-            print(colored(f"📊 Forwarding {len(latest_messages)} stored messages", "cyan"))
-            print(colored("🔄 PROFESSIONAL FORWARDING WITH FALLBACKS", "magenta"))
+        client = TelegramClient(session_name, api_id, api_hash)
+        forwarder = None
+        
+        try:
+            await client.start(phone_number)
+            emit(f"✅ Perfect connection: {phone_number}", "green")
+            backoff = RESTART_BACKOFF_MIN
+            
+            # Take admin messages from the moment we're connected, so none
+            # arriving during the (possibly long) warm-up are dropped
+            await handle_admin_messages(client, admin_ids, session_name)
+            
+            # Resolve targets from the dialog list before the first send
+            try:
+                resolved, unreachable = await warm_up(client, session_name)
+                emit(f"🔥 Warm-up: {resolved} chats resolved from dialogs, "
+                     f"{unreachable} targets unreachable", "cyan")
+                if unreachable:
+                    print_health_summary(session_name)
+            except Exception as e:
+                emit(f"⚠️ Warm-up skipped for {phone_number}: {e}", "yellow", level=logging.WARNING)
+            
+            # Start enhanced services
+            forwarder = asyncio.create_task(auto_forwarder(client, session_name))
             
-            total_sent = 0
-            # Forward all stored messages with better progress
-            for message_id, message in list(latest_messages.items()):
-                msg_index = list(latest_messages.keys()).index(message_id) + 1
-                print(colored(f"\n📨 Forwarding message {msg_index}/{len(latest_messages)}", "yellow"))
-                sent_count = await forward_to_all_groups(client, message, session_name)
-                total_sent += sent_count
+            emit(f"\n🤖 PERFECT FORWARDER IS RUNNING FOR {phone_number}!", "green", attrs=['bold'])
+            emit("💡 Send messages from admin to forward", "cyan")
+            emit("🔄 PROFESSIONAL FORWARDING WITH FALLBACKS", "magenta")
+            emit("⏰ Each target served when its cooldown expires", "yellow")
+            emit("=" * 60, "white")
             
-            # Enhanced wait message
-            print(colored(f"\n⏳ Perfect forwarding completed. Waiting 1 hour...", "blue"))
-            print(colored(f"💤 Next auto-cycle at: {time.strftime('%H:%M:%S', time.localtime(time.time() + 3600))}", "cyan"))
-            await asyncio.sleep(3600)
+            await client.run_until_disconnected()
+            emit(f"⚠️ {phone_number} disconnected", "yellow", level=logging.WARNING)
+            
+        except Exception as e:
+            emit(f"❌ Failed for {phone_number}: {e}", "red")
+        finally:
+            if forwarder:
+                forwarder.cancel()
+            await client.disconnect()
+        
+        if lifecycle.stopping.is_set():
+            return
+        emit(f"🔁 Restarting {phone_number} in {backoff}s...", "yellow", level=logging.WARNING)
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, RESTART_BACKOFF_MAX)
+
+def read_accounts(path=json_path):
+    """Load acc.json, raising ValueError if it is not a usable account list"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, list):
+        raise ValueError("expected a list of accounts")
+    sessions = set()
+    for i, account in enumerate(data, 1):
+        if not isinstance(account, dict):
+            raise ValueError(f"account #{i} is not an object")
+        missing = [field for field in ACCOUNT_FIELDS if field not in account]
+        if missing:
+            raise ValueError(f"account #{i} is missing {', '.join(missing)}")
+        if account['session_name'] in sessions:
+            raise ValueError(f"duplicate session_name {account['session_name']}")
+        sessions.add(account['session_name'])
+    return data
+
+def read_target_links(path=groups_path):
+    """Non-empty lines of groups.txt"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def apply_targets(links):
+    """Swap in a new target table and hand the difference to every scheduler
+    
+    Returns (added, removed) target lists. Cooldowns, health records and the
+    entity cache are keyed by target, so they carry over untouched.
+    """
+    global target_links, target_table, targets
+    known = {target.original_link: target for target in targets}
+    known.update((link, None) for _, link in target_table.invalid)
+    known.update((link, parse_telegram_link(link)) for _, link in target_table.duplicates)
+    table = build_target_table(links, known)
+    if links and not table.targets:
+        raise ValueError("no valid links")
+    
+    old = {target_identity(target): target for target in targets}
+    new = {target_identity(target): target for target in table.targets}
+    added = [target for identity, target in new.items() if identity not in old]
+    removed = [target for identity, target in old.items() if identity not in new]
+    
+    target_links, target_table, targets = links, table, table.targets
+    for state in account_states.values():
+        state.scheduler.sync_targets(targets)
+    return added, removed
+
+# Supervisor task per session_name, so acc.json edits can start and stop accounts
+account_tasks = {}
+
+async def restart_account(previous, account):
+    """Let the old supervisor disconnect before its session file is reused"""
+    await asyncio.gather(previous, return_exceptions=True)
+    await run_account(account)
+
+def start_account(account, previous=None):
+    session_name = account['session_name']
+    runner = restart_account(previous, account) if previous else run_account(account)
+    account_tasks[session_name] = asyncio.create_task(runner)
+
+def stop_account(session_name):
+    """Cancel an account's supervisor - its finally block disconnects the client"""
+    task = account_tasks.pop(session_name, None)
+    if task:
+        task.cancel()
+    return task
+
+def apply_accounts(new_accounts):
+    """Start added accounts, stop removed ones and restart changed ones
+    
+    An edit that only touches admin_ids is applied in place without
+    reconnecting, as long as the account is still running (one started
+    without admin_ids has already exited and must be started again);
+    accounts that did not change are left alone.
+    """
+    global accounts
+    old = {account['session_name']: account for account in accounts}
+    new = {account['session_name']: account for account in new_accounts}
+    
+    for session_name in old.keys() - new.keys():
+        stop_account(session_name)
+        emit(f"➖ Account {session_name} removed - disconnecting", "yellow")
+    for session_name, account in new.items():
+        previous = old.get(session_name)
+        if previous is None:
+            start_account(account)
+            emit(f"➕ Account {session_name} added - connecting", "green")
+        elif previous != account:
+            unchanged = {key: value for key, value in account.items() if key != 'admin_ids'}
+            task = account_tasks.get(session_name)
+            running = task is not None and not task.done()
+            if running and unchanged == {key: value for key, value in previous.items() if key != 'admin_ids'}:
+                account_state(session_name).admin_ids = set(account.get('admin_ids', []))
+                emit(f"🔑 Account {session_name}: admin_ids updated", "cyan")
+            else:
+                start_account(account, previous=stop_account(session_name))
+                emit(f"🔁 Account {session_name} changed - reconnecting", "yellow")
+    accounts = new_accounts
+
+def reload_targets(path):
+    added, removed = apply_targets(read_target_links(path))
+    emit(f"🔄 groups.txt reloaded: {len(targets)} targets "
+         f"(+{len(added)} / -{len(removed)})", "cyan")
+
+def reload_accounts(path):
+    apply_accounts(read_accounts(path))
+    emit(f"🔄 acc.json reloaded: {len(accounts)} account(s)", "cyan")
+
+class ConfigWatcher:
+    """Poll file modification times and re-apply a file when it changes
+    
+    A reload that fails (unreadable file, bad JSON, no valid links) is
+    rejected and the running configuration is kept.
+    """
+
+    def __init__(self, interval=CONFIG_POLL_INTERVAL):
+        self.interval = interval
+        self.files = {}
+
+    @staticmethod
+    def mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def watch(self, path, reload):
+        self.files[path] = [self.mtime(path), reload]
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            for path, entry in self.files.items():
+                mtime = self.mtime(path)
+                if mtime is None or mtime == entry[0]:
+                    continue
+                entry[0] = mtime
+                try:
+                    entry[1](path)
+                except Exception as e:
+                    name = os.path.basename(path)
+                    emit(f"❌ Rejected {name} edit, keeping current config: {e}", "red")
+
+def load_config(read_only=False):
+    """Load bot_config.json, acc.json and groups.txt; False if one is unusable"""
+    global accounts, settings, target_overrides
+    try:
+        open_state(state_db_path, read_only=read_only)
+    except sqlite3.Error as e:
+        emit(f"❌ Unable to open {state_db_path}: {e}", "red")
+        return False
+    try:
+        settings, target_overrides = load_settings()
+    except Exception as e:
+        emit(f"❌ Invalid bot_config.json: {e}", "red")
+        return False
+    apply_log_levels()
+    try:
+        accounts = read_accounts()
+    except Exception as e:
+        emit(f"❌ Unable to load acc.json: {e}", "red")
+        return False
+    try:
+        apply_targets(read_target_links())
+        emit(f"✅ Loaded {len(target_links)} groups from groups.txt", "green")
+    except Exception as e:
+        emit(f"❌ Unable to load groups.txt: {e}", "red")
+        return False
+    return True
+
+def plan_account(session_name, now=None):
+    """Dry-run schedule for one account from cached state only - no RPCs
+
+    Mirrors the scheduler: each target is ready when its cooldown and any
+    backoff end, then sends are spaced by delay_between_forwards per account
+    and DESTINATION_INTERVAL per chat. Targets missing from the entity cache
+    are assumed sendable now (their cooldown isn't known until resolved).
+    """
+    now = now or time.time()
+    state = account_state(session_name)
+    entries = []
+    ready = []
+    for target in targets:
+        entry = {'target': target.original_link, 'type': target.type, 'status': None,
+                 'eta': None, 'reason': None}
+        entries.append(entry)
+        record = state.health.get(target)
+        cached = group_cache.peek(session_name, entity_cache_key(target))
+        if record and record.quarantined and record.retry_at > now:
+            entry.update(status='quarantined', eta=record.retry_at, reason=record.reason)
+            continue
+        if cached and not cached['peer_type']:
+            entry.update(status='unreachable', reason="Link did not resolve")
+            continue
+        
+        due = now
+        status = 'send'
+        if cached:
+            last_sent = state.last_sent_times.get(cooldown_key(cached['peer_id'], target), 0)
+            cooldown_end = last_sent + target_settings(target).cooldown_period
+            if cooldown_end > due:
+                due, status = cooldown_end, 'cooldown'
         else:
-            # No messages available, check every 5 minutes
-            print(colored("⏳ No messages available for perfect auto-forwarding, checking again in 5 minutes...", "yellow"))
-            await asyncio.sleep(300)
+            entry['reason'] = "Not resolved yet"
+        if record and record.retry_at > due:
+            due, status, entry['reason'] = record.retry_at, 'backoff', record.reason
+        entry['status'] = status
+        destination = cached['peer_id'] if cached else entity_cache_key(target)
+        ready.append((due, len(ready), destination, entry))
+    
+    # Pace the sends the way the rate limiter would
+    ready.sort(key=lambda item: item[:2])
+    account_next = now
+    destination_next = {}
+    for due, _, destination, entry in ready:
+        send_at = max(due, account_next, destination_next.get(destination, 0))
+        entry['eta'] = send_at
+        account_next = send_at + settings.delay_between_forwards
+        destination_next[destination] = send_at + DESTINATION_INTERVAL
+    
+    counts = {}
+    for entry in entries:
+        counts[entry['status']] = counts.get(entry['status'], 0) + 1
+    pass_etas = [entry['eta'] for entry in entries if entry['status'] == 'send']
+    return {
+        'session': session_name,
+        'messages': len(state.latest_messages),
+        'counts': counts,
+        'unresolved': sum(1 for entry in entries if entry['reason'] == "Not resolved yet"),
+        'pass_seconds': round(max(pass_etas) - now, 1) if pass_etas else 0,
+        'completes_at': max((entry['eta'] for entry in entries if entry['status'] != 'quarantined'
+                             and entry['eta']), default=now),
+        'targets': entries,
+    }
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+def run_plan(path):
+    """Write a dry-run delivery plan for every account to `path` and summarise it"""
+    started = time.perf_counter()
+    # Read-only: a plan must never create, migrate or prune bot_state.db
+    if not load_config(read_only=True):
+        return
+    restore_state(persist=False)
+    now = time.time()
+    plan = {
+        'generated_at': now,
+        'settings': settings._asdict(),
+        'targets': len(targets),
+        'accounts': [],
+    }
+    for account in accounts:
+        session_name = account['session_name']
+        if not account.get('admin_ids'):
+            plan['accounts'].append({'session': session_name, 'skipped': "No admin_ids"})
+            continue
+        plan['accounts'].append(plan_account(session_name, now))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(plan, f, indent=2, ensure_ascii=False)
+    
+    emit("🗺️ DRY-RUN DELIVERY PLAN (nothing is sent)", "green", attrs=['bold'])
+    for account_plan in plan['accounts']:
+        if 'skipped' in account_plan:
+            emit(f"   • {account_plan['session']}: skipped ({account_plan['skipped']})", "yellow")
+            continue
+        counts = account_plan['counts']
+        done = time.strftime('%d %b %H:%M', time.localtime(account_plan['completes_at']))
+        emit(f"   • {account_plan['session']}: {counts.get('send', 0)} sends now "
+             f"({account_plan['unresolved']} unresolved), {counts.get('cooldown', 0)} on cooldown, "
+             f"{counts.get('backoff', 0)} backing off, {counts.get('quarantined', 0)} quarantined, "
+             f"{counts.get('unreachable', 0)} unreachable", "cyan")
+        emit(f"     pass ≈ {format_duration(account_plan['pass_seconds'])}, "
+             f"all targets served by {done}, {account_plan['messages']} stored message(s)", "cyan")
+        if not account_plan['messages']:
+            emit("     nothing stored yet - sends start when an admin message arrives", "yellow")
+    emit(f"💾 Plan written to {path} in {(time.perf_counter() - started) * 1000:.0f} ms", "blue")
+
+class Lifecycle:
+    """Owns the background tasks and runs the shutdown sequence
+
+    On SIGINT/SIGTERM intake stops, in-flight sends get
+    SHUTDOWN_DRAIN_TIMEOUT seconds to finish and be checkpointed, then every
+    client disconnects and the state store is flushed. A second signal skips
+    the wait.
+    """
+
+    def __init__(self):
+        self.stopping = asyncio.Event()
+        self.forced = False
+        self.tasks = set()
+
+    def spawn(self, coro):
+        """Start a background task and keep a reference until it finishes"""
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def install_signal_handlers(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.request_stop, sig.name)
+            except (NotImplementedError, RuntimeError):
+                # Windows: Ctrl+C still arrives as KeyboardInterrupt
+                pass
+
+    def request_stop(self, reason="shutdown requested"):
+        if self.stopping.is_set():
+            self.forced = True
+            emit("⚠️ Second signal - not waiting for in-flight sends", "yellow", level=logging.WARNING)
+            return
+        emit(f"\n🛑 {reason}: finishing in-flight sends...", "yellow")
+        self.stopping.set()
+
+    @staticmethod
+    def in_flight():
+        return sum(len(state.scheduler.active) for state in account_states.values())
+
+    async def drain(self, timeout=SHUTDOWN_DRAIN_TIMEOUT):
+        """Wait for in-flight sends; True if they all finished in time"""
+        deadline = time.monotonic() + timeout
+        while self.in_flight() and not self.forced and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        return not self.in_flight()
+
+    async def shutdown(self, metrics_server=None):
+        drained = await self.drain()
+        if not drained:
+            emit(f"⚠️ {self.in_flight()} send(s) still in flight - they will be retried next run",
+                 "yellow", level=logging.WARNING)
+        # No more config reloads or exports, then checkpoint before the clients go away
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        state_store.flush()
+        group_cache.flush()
+        
+        # Each supervisor's finally block cancels its workers and disconnects
+        supervisors = [stop_account(session_name) for session_name in list(account_tasks)]
+        if supervisors:
+            await asyncio.wait(supervisors, timeout=SHUTDOWN_DISCONNECT_TIMEOUT)
+        if metrics_server:
+            metrics_server.close()
+            await metrics_server.wait_closed()
+        state_store.flush()
+        group_cache.flush()
+        emit("👋 Perfect forwarder stopped gracefully", "yellow")
+
+lifecycle = Lifecycle()
 
 async def main():
+    if not load_config():
+        return
+    lifecycle.install_signal_handlers()
+    
     clear_terminal()
-    print(colored("🚀 PERFECT TELEGRAM AUTO-FORWARDER", "green", attrs=['bold']))
-    print(colored(f"📋 Loaded {len(target_links)} targets", "cyan"))
-    print(colored("🔄 PROFESSIONAL FORWARDING WITH FALLBACKS", "magenta", attrs=['bold']))
-    print(colored("⚡ Enhanced bot support & link parsing", "yellow"))
-    print(colored("💾 Stores ALL admin messages securely", "green"))
-    print(colored("⏰ Smart delays based on performance", "blue"))
-    print(colored("⏳ 1-hour fixed gap between cycles", "cyan"))
-    print(colored("🎯 Perfect error handling with fallbacks", "blue"))
-    print(colored("=" * 60, "white"))
+    emit("🚀 PERFECT TELEGRAM AUTO-FORWARDER", "green", attrs=['bold'])
+    emit(f"📋 Loaded {len(targets)} targets", "cyan")
+    emit("🔄 PROFESSIONAL FORWARDING WITH FALLBACKS", "magenta", attrs=['bold'])
+    emit("⚡ Enhanced bot support & link parsing", "yellow")
+    emit("💾 Stores ALL admin messages securely", "green")
+    emit("⏰ Smart delays based on performance", "blue")
+    emit(f"⏳ {settings.cooldown_period / 60:g}min cooldown per target, "
+         f"{settings.delay_between_forwards}s between sends", "cyan")
+    emit("🎯 Perfect error handling with fallbacks", "blue")
+    emit("=" * 60, "white")
+    
+    # Restore state saved by the previous run
+    saved = restore_state()
+    emit(f"💾 Restored {sum(map(len, saved['last_sent_times'].values()))} cooldowns, "
+         f"{sum(map(len, saved['messages'].values()))} messages, "
+         f"{len(saved['sent_counters'])} counters", "green")
+    lifecycle.spawn(state_flusher())
+    lifecycle.spawn(metrics_exporter())
+    metrics_server = None
+    if METRICS_HOST:
+        try:
+            metrics_server = await serve_metrics()
+        except OSError as e:
+            emit(f"⚠️ Metrics endpoint disabled: {e}", "yellow", level=logging.WARNING)
     
     # Enhanced target analysis
-    print(colored("🔍 Perfect Target Analysis:", "blue"))
-    valid_targets = 0
+    emit("🔍 Perfect Target Analysis:", "blue")
     target_types = {}
     
-    for i, link in enumerate(target_links, 1):
-        link_info = parse_telegram_link(link)
-        if link_info:
-            valid_targets += 1
-            target_type = link_info['type']
-            target_types[target_type] = target_types.get(target_type, 0) + 1
-            
-            if target_type == 'bot':
-                icon = "🤖"
-                info = "Bot"
-            elif target_type == 'topic':
-                icon = "📚"
-                info = f"Topic {link_info['topic_id']}"
-            elif target_type == 'private_topic':
-                icon = "🔒📚" 
-                info = f"Private Topic {link_info['topic_id']}"
-            else:
-                icon = "👥"
-                info = "Group/Chat"
-                
-            display_name = link_info['username'] if 'username' in link_info else link_info['original_link']
-            print(colored(f"   {i:2d}. {icon} {display_name} - {info}", "cyan"))
+    for i, link_info in enumerate(targets, 1):
+        target_type = link_info.type
+        target_types[target_type] = target_types.get(target_type, 0) + 1
+        
+        if target_type == 'bot':
+            icon = "🤖"
+            info = "Bot"
+        elif target_type == 'topic':
+            icon = "📚"
+            info = f"Topic {link_info.topic_id}"
+        elif target_type == 'private_topic':
+            icon = "🔒📚" 
+            info = f"Private Topic {link_info.topic_id}"
         else:
-            print(colored(f"   {i:2d}. ❌ {link} (Invalid - will skip)", "red"))
+            icon = "👥"
+            info = "Group/Chat"
+            
+        display_name = link_info.username or link_info.original_link
+        emit(f"   {i:2d}. {icon} {display_name} - {info}", "cyan")
     
     # Enhanced summary
-    print(colored(f"\n📊 Perfect Summary:", "green"))
+    emit(f"\n📊 Perfect Summary:", "green")
     for ttype, count in target_types.items():
         type_name = ttype.replace('_', ' ').title()
-        print(colored(f"   • {type_name}: {count}", "cyan"))
-    print(colored(f"   • Total Valid: {valid_targets}/{len(target_links)}", 
-                  "green" if valid_targets == len(target_links) else "yellow"))
+        emit(f"   • {type_name}: {count}", "cyan")
+    if target_table.duplicates:
+        emit(f"   • Duplicates skipped: {len(target_table.duplicates)}", "yellow")
+    if target_table.invalid:
+        emit(f"   • Invalid skipped: {len(target_table.invalid)}", "red")
+    emit(f"   • Total Valid: {len(targets)}/{len(target_links)}", 
+         "green" if len(targets) == len(target_links) else "yellow")
     
-    print(colored("=" * 60, "white"))
+    emit("=" * 60, "white")
     
-    # Process each account
+    # Start every account concurrently - each one is supervised on its own,
+    # then keep following acc.json/groups.txt for changes until told to stop
     for account in accounts:
-        api_id = account["api_id"]
-        api_hash = account["api_hash"]
-        phone_number = account["phone_number"]
-        session_name = account["session_name"]
-        admin_ids = account.get("admin_ids", [])
-        
-        if not admin_ids:
-            print(colored(f"❌ No admin_ids for {phone_number}", "red"))
-            continue
-            
-        client = TelegramClient(session_name, api_id, api_hash)
-        
-        try:
-            await client.start(phone_number)
-            print(colored(f"✅ Perfect connection: {phone_number}", "green"))
-            
-            # Start enhanced services
-            await handle_admin_messages(client, admin_ids, session_name)
-            asyncio.create_task(auto_forwarder(client, session_name))
-            
-            print(colored("\n🤖 PERFECT FORWARDER IS RUNNING!", "green", attrs=['bold']))
-            print(colored("💡 Send messages from admin to forward", "cyan"))
-            print(colored("🔄 PROFESSIONAL FORWARDING WITH FALLBACKS", "magenta"))
-            print(colored("🤖 Bot support enabled", "green"))
-            print(colored("⏰ Smart delays based on performance", "yellow"))
-            print(colored("🔄 Automatic forwarding every hour", "magenta"))
-            print(colored("⏳ 1-hour fixed gap between all cycles", "blue"))
-            print(colored("🎯 Perfect error handling", "blue"))
-            print(colored("=" * 60, "white"))
-            
-            await client.run_until_disconnected()
-            
-        except Exception as e:
-            print(colored(f"❌ Failed for {phone_number}: {e}", "red"))
+        start_account(account)
+    watcher = ConfigWatcher()
+    watcher.watch(json_path, reload_accounts)
+    watcher.watch(groups_path, reload_targets)
+    lifecycle.spawn(watcher.run())
+    
+    try:
+        await lifecycle.stopping.wait()
+    except asyncio.CancelledError:
+        # KeyboardInterrupt where signal handlers aren't available
+        lifecycle.stopping.set()
+    await lifecycle.shutdown(metrics_server)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Telegram auto-forwarder")
+    parser.add_argument('--plan', nargs='?', const=plan_path, metavar='PATH',
+                        help="write a dry-run delivery plan as JSON and exit without sending")
+    args = parser.parse_args()
+    setup_logging()
     try:
-        asyncio.run(main())
+        if args.plan:
+            run_plan(args.plan)
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
-        print(colored("\n👋 Perfect forwarder stopped gracefully", "yellow"))
+        emit("\n🛑 Interrupted", "yellow")
     except Exception as e:
-        print(colored(f"❌ Critical error: {e}", "red"))
\ No newline at end of file
+        emit(f"❌ Critical error: {e}", "red")
+    finally:
+        state_store.close()
+        group_cache.close()
+        log_listener.stop()
\ No newline at end of file
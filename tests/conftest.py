@@ -0,0 +1,21 @@
+"""Fixtures that reset bot.py's module-level state around a test"""
+import pytest
+
+import bench
+import bot
+
+
+@pytest.fixture
+def fresh_bot():
+    """In-memory state, no targets"""
+    bench.reset_bot([], 1.0)
+    yield
+    bench.reset_bot([], 1.0)
+
+
+@pytest.fixture
+def closed_state():
+    """Put the in-memory placeholders back after a test opens a database"""
+    yield
+    bot.open_state(':memory:', read_only=True)
+    bench.reset_bot([], 1.0)
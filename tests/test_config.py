@@ -0,0 +1,193 @@
+"""Target links, settings validation and live acc.json/groups.txt reloads"""
+import asyncio
+
+import pytest
+
+import bench
+import bot
+
+
+@pytest.mark.parametrize('link, expected', [
+    ('https://t.me/somegroup', ('username', 'somegroup', None, None)),
+    ('t.me/somegroup/', ('username', 'somegroup', None, None)),
+    ('@somegroup', ('username', 'somegroup', None, None)),
+    ('somegroup', ('username', 'somegroup', None, None)),
+    ('https://t.me/somegroup/42', ('topic', 'somegroup', None, 42)),
+    ('https://t.me/c/1234567890/15', ('private_topic', None, 1234567890, 15)),
+    ('https://t.me/c/1234567890/15?thread=3', ('private_topic', None, 1234567890, 15)),
+    ('https://t.me/helper_bot?start=abc', ('bot', 'helper_bot', None, None)),
+    ('  https://t.me/somegroup  ', ('username', 'somegroup', None, None)),
+])
+def test_parse_telegram_link(link, expected):
+    target = bot.parse_telegram_link(link)
+    assert (target.type, target.username, target.channel_id, target.topic_id) == expected
+    assert target.original_link == link.strip()
+
+
+@pytest.mark.parametrize('link', ['', 'https://example.com/group', 't.me/', 'not a link!'])
+def test_parse_telegram_link_rejects_invalid(link):
+    assert bot.parse_telegram_link(link) is None
+
+
+def test_check_settings_accepts_valid_values():
+    bot.check_settings({
+        'delay_between_forwards': 0.5,
+        'cooldown_period': 0,
+        'max_retries': 3,
+        'enable_drop_author': True,
+        'enable_silent_mode': False,
+        'log_level': 'debug',
+    }, 'test')
+
+
+@pytest.mark.parametrize('values, message', [
+    ({'delay_between_forwards': 0}, 'greater than 0'),
+    ({'delay_between_forwards': -1}, 'greater than 0'),
+    ({'cooldown_period': -5}, 'at least 0'),
+    ({'max_retries': 0}, 'at least 1'),
+    ({'max_retries': 2.5}, 'wrong type'),
+    ({'cooldown_period': True}, 'wrong type'),
+    ({'enable_silent_mode': 1}, 'wrong type'),
+    ({'log_level': 'LOUD'}, 'log_level must be one of'),
+    ({'no_such_setting': 1}, "can't be set here"),
+])
+def test_check_settings_rejects(values, message):
+    with pytest.raises(ValueError, match=message):
+        bot.check_settings(values, 'test')
+
+
+def test_check_settings_restricts_target_overrides():
+    bot.check_settings({'cooldown_period': 60}, 'override', bot.TARGET_SETTINGS)
+    with pytest.raises(ValueError, match="can't be set here"):
+        bot.check_settings({'delay_between_forwards': 5}, 'override', bot.TARGET_SETTINGS)
+
+
+def account(admin_ids, session_name='acc1'):
+    return {'api_id': 1, 'api_hash': 'hash', 'phone_number': '+100',
+            'session_name': session_name, 'admin_ids': admin_ids}
+
+
+@pytest.fixture
+def fake_supervisors(monkeypatch):
+    """run_account stand-in: returns at once without admins, else runs until cancelled"""
+    started = []
+
+    async def run_account(acc):
+        started.append(acc)
+        if acc['admin_ids']:
+            await asyncio.sleep(3600)
+
+    monkeypatch.setattr(bot, 'run_account', run_account)
+    monkeypatch.setattr(bot, 'accounts', [])
+    bot.account_tasks.clear()
+    yield started
+    for task in bot.account_tasks.values():
+        task.cancel()
+    bot.account_tasks.clear()
+
+
+def test_apply_accounts_updates_admins_in_place(fresh_bot, fake_supervisors):
+    async def scenario():
+        bot.apply_accounts([account([1])])
+        await asyncio.sleep(0)
+        bot.apply_accounts([account([1, 2])])
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert len(fake_supervisors) == 1
+    assert bot.account_state('acc1').admin_ids == {1, 2}
+
+
+def test_apply_accounts_starts_account_that_gained_admins(fresh_bot, fake_supervisors):
+    async def scenario():
+        bot.apply_accounts([account([])])
+        await asyncio.sleep(0)
+        # The supervisor gave up straight away - adding admins must start it again
+        bot.apply_accounts([account([7])])
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return bot.account_tasks['acc1'].done()
+
+    assert asyncio.run(scenario()) is False
+    assert [acc['admin_ids'] for acc in fake_supervisors] == [[], [7]]
+
+
+def test_apply_accounts_adds_and_removes(fresh_bot, fake_supervisors):
+    async def scenario():
+        bot.apply_accounts([account([1], 'acc1')])
+        await asyncio.sleep(0)
+        first = bot.account_tasks['acc1']
+        bot.apply_accounts([account([1], 'acc2')])
+        await asyncio.sleep(0)
+        return first
+
+    first = asyncio.run(scenario())
+    assert first.cancelled()
+    assert set(bot.account_tasks) == {'acc2'}
+
+
+class ConnectingClient(bench.FakeClient):
+    """Enough of TelegramClient for run_account; records when warm-up runs"""
+
+    handlers_during_warm_up = None
+
+    def __init__(self, *args):
+        super().__init__()
+
+    async def start(self, phone_number):
+        pass
+
+    async def iter_dialogs(self):
+        ConnectingClient.handlers_during_warm_up = len(self.handlers)
+        return
+        yield
+
+    async def run_until_disconnected(self):
+        await asyncio.sleep(3600)
+
+    async def disconnect(self):
+        pass
+
+
+def test_intake_is_registered_before_warm_up(fresh_bot, monkeypatch):
+    monkeypatch.setattr(bot, 'TelegramClient', ConnectingClient)
+    bench.reset_bot([bot.parse_telegram_link("https://t.me/group1")], 1.0)
+
+    async def scenario():
+        task = asyncio.create_task(bot.run_account(account([42])))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert ConnectingClient.handlers_during_warm_up == 1
+
+
+def test_apply_targets_reports_changes_and_syncs_schedulers(fresh_bot):
+    bot.apply_targets([])
+    scheduler = bot.account_state('acc1').scheduler
+    added, removed = bot.apply_targets(["https://t.me/group1", "https://t.me/group2/5"])
+    assert [t.original_link for t in added] == ["https://t.me/group1", "https://t.me/group2/5"]
+    assert removed == []
+    assert len(scheduler) == 2
+
+    added, removed = bot.apply_targets(["@GROUP1", "not a link!", "https://t.me/group3"])
+    # @GROUP1 is the same chat as https://t.me/group1, so nothing changes for it
+    assert [t.original_link for t in added] == ["https://t.me/group3"]
+    assert [t.original_link for t in removed] == ["https://t.me/group2/5"]
+    assert [t.original_link for t in bot.targets] == ["@GROUP1", "https://t.me/group3"]
+    assert bot.target_table.invalid == ((2, "not a link!"),)
+    assert set(scheduler.due) == {bot.target_identity(t) for t in bot.targets}
+
+
+def test_apply_targets_rejects_a_file_without_valid_links(fresh_bot):
+    bot.apply_targets(["https://t.me/group1"])
+    with pytest.raises(ValueError):
+        bot.apply_targets(["not a link!"])
+    assert [t.original_link for t in bot.targets] == ["https://t.me/group1"]
+
+
+def test_build_target_table_drops_duplicates():
+    table = bot.build_target_table(["https://t.me/group1", "t.me/Group1", "https://t.me/group1/4"])
+    assert [t.original_link for t in table.targets] == ["https://t.me/group1", "https://t.me/group1/4"]
+    assert table.duplicates == ((2, "t.me/Group1"),)
@@ -0,0 +1,313 @@
+"""Scheduler, batching, error handling and the delivery worker"""
+import asyncio
+import datetime
+import time
+
+import pytest
+from telethon.errors import ChatWriteForbiddenError, FloodWaitError, RPCError
+from telethon.tl.types import Channel, InputPeerChat, Message, MessageMediaPhoto, PeerUser, Photo
+
+import bench
+import bot
+
+
+def telethon_photo_message(message_id, sender_id=42):
+    """A real Telethon Message carrying only a photo (no caption)"""
+    photo = Photo(id=900 + message_id, access_hash=1, file_reference=b'ref', date=None,
+                  sizes=[], dc_id=1)
+    return Message(id=message_id, peer_id=PeerUser(sender_id), date=datetime.datetime.now(),
+                   message='', media=MessageMediaPhoto(photo=photo))
+
+
+def test_intake_stores_media_only_message(fresh_bot):
+    client = bench.FakeClient()
+    asyncio.run(bot.handle_admin_messages(client, [42], 'test'))
+    message = telethon_photo_message(7)
+    asyncio.run(client.handlers[0](bench.FakeEvent(client, 42, message)))
+
+    state = bot.account_state('test')
+    [(key, stored)] = state.latest_messages.items()
+    assert (stored.chat_id, stored.message_id, stored.text) == (42, 7, None)
+    assert (stored.media.kind, stored.media.media_id) == ('photo', 907)
+    assert bot.describe_message(stored) == bot.MEDIA_LABELS['photo']
+
+
+class FloodingClient(bench.FakeClient):
+    """get_messages always answers with a flood wait"""
+
+    async def get_messages(self, chat_id, ids=None):
+        self.rpc('get_messages')
+        raise FloodWaitError(None, capture=120)
+
+
+def test_flood_wait_while_fetching_pauses_account(fresh_bot):
+    targets = [bot.parse_telegram_link(f"https://t.me/group{i}") for i in range(3)]
+    bench.reset_bot(targets, 1.0)
+    client = FloodingClient()
+    state = bot.account_state('test')
+    state.latest_messages.add('1_1_0', bot.StoredMessage(1, 1))
+
+    async def scenario():
+        task = asyncio.create_task(bot.auto_forwarder(client, 'test', workers=2))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert state.limiter.is_paused()
+    # One fetch hit the flood wait; every other job waited instead of retrying
+    assert client.rpcs == {'get_messages': 1}
+    assert set(state.scheduler.due.values()) == {state.limiter.paused_until}
+
+
+class SlowFetchClient(bench.FakeClient):
+    """get_messages never returns"""
+
+    async def get_messages(self, chat_id, ids=None):
+        self.rpc('get_messages')
+        await asyncio.sleep(3600)
+
+
+def test_cancelled_worker_releases_its_target(fresh_bot):
+    target = bot.parse_telegram_link("https://t.me/group1")
+    bench.reset_bot([target], 1.0)
+    client = SlowFetchClient()
+    state = bot.account_state('test')
+    state.latest_messages.add('1_1_0', bot.StoredMessage(1, 1))
+
+    async def scenario():
+        task = asyncio.create_task(bot.auto_forwarder(client, 'test', workers=1))
+        await asyncio.sleep(0.05)
+        assert client.rpcs == {'get_messages': 1}
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
+    scheduler = state.scheduler
+    assert scheduler.active == set()
+    assert list(scheduler.due) == [bot.target_identity(target)]
+
+
+def test_input_media_uses_each_messages_file_reference():
+    first = telethon_photo_message(1)
+    refreshed = telethon_photo_message(1)
+    refreshed.media.photo.file_reference = b'fresh'
+    assert bot.input_media(first).id.file_reference == b'ref'
+    assert bot.input_media(refreshed).id.file_reference == b'fresh'
+
+
+def test_delete_by_number_matches_listing(fresh_bot):
+    client = bench.FakeClient()
+    state = bot.account_state('test')
+    for i in range(3):
+        state.latest_messages.add(f"m{i}", bot.StoredMessage(1, i, f"text {i}"),
+                                  stored_at=time.time() - 10 + i)
+    # A delivery job touches the oldest message between the listing and /delete
+    state.latest_messages.get('m0')
+
+    class CommandEvent(bench.FakeEvent):
+        def __init__(self, text):
+            super().__init__(client, 42, bench.FakeMessage(99, text=text))
+            self.replies = []
+
+        async def reply(self, text):
+            self.replies.append(text)
+
+    event = CommandEvent("/delete 1")
+    assert asyncio.run(bot.handle_store_command(event, state))
+    assert event.replies == ["🗑️ Deleted m0"]
+    assert state.latest_messages.keys() == ['m1', 'm2']
+
+
+def target(link="https://t.me/group1"):
+    return bot.parse_telegram_link(link)
+
+
+@pytest.mark.parametrize('error, expected', [
+    (ChatWriteForbiddenError(None), bot.PERMANENT),
+    (RPCError(None, 'TOPIC_CLOSED', 400), bot.PERMANENT),
+    (FloodWaitError(None, capture=30), bot.RETRY_LATER),
+    (ConnectionError("reset"), bot.RETRY_LATER),
+    (asyncio.TimeoutError(), bot.RETRY_LATER),
+    (RPCError(None, 'SOMETHING_ODD', 400), bot.TRANSIENT),
+    (ValueError("bad"), bot.TRANSIENT),
+])
+def test_classify_error(error, expected):
+    assert bot.classify_error(error) == expected
+
+
+def test_transient_failures_back_off_then_quarantine(fresh_bot, monkeypatch):
+    monkeypatch.setattr(bot.time, 'time', lambda: 1000.0)
+    health = bot.HealthTracker('acc1')
+    group = target()
+    for attempt in range(1, bot.settings.max_retries):
+        health.record_failure(group, "flaky", bot.TRANSIENT)
+        record = health.get(group)
+        assert not record.quarantined
+        backoff = min(bot.TARGET_BACKOFF_BASE * 2 ** (attempt - 1), bot.TARGET_BACKOFF_MAX)
+        assert record.retry_at == 1000.0 + backoff
+    health.record_failure(group, "flaky", bot.TRANSIENT)
+    assert health.get(group).quarantined
+    assert health.retry_at(group) == 1000.0 + bot.QUARANTINE_PERIOD
+    assert health.quarantined() == [(bot.target_key(group), health.get(group))]
+
+    health.record_success(group)
+    assert health.get(group) is None
+
+
+def test_permanent_failure_quarantines_at_once(fresh_bot):
+    health = bot.HealthTracker('acc1')
+    health.record_failure(target(), "No write permission", bot.PERMANENT)
+    assert health.get(target()).quarantined
+
+
+def test_retry_later_defers_without_counting(fresh_bot):
+    health = bot.HealthTracker('acc1')
+    health.record_failure(target(), "timeout", bot.RETRY_LATER)
+    record = health.get(target())
+    assert (record.failures, record.quarantined) == (0, False)
+    assert record.retry_at > time.time()
+
+
+def test_group_batch_keeps_albums_together():
+    messages = [
+        bench.FakeMessage(3, chat_id=1, grouped_id=77),
+        bench.FakeMessage(1, chat_id=1),
+        bench.FakeMessage(2, chat_id=1, grouped_id=77),
+        bench.FakeMessage(5, chat_id=2),
+        bench.FakeMessage(4, chat_id=1),
+    ]
+    groups = bot.group_batch(messages)
+    assert {chat: [[m.id for m in unit] for unit in units] for chat, units in groups.items()} == {
+        1: [[1], [2, 3], [4]],
+        2: [[5]],
+    }
+
+
+def test_chunk_units_never_splits_an_album():
+    units = [[1], [2, 3, 4], [5], [6, 7]]
+    assert list(bot.chunk_units(units, limit=4)) == [[1, 2, 3, 4], [5, 6, 7]]
+    assert list(bot.chunk_units(units, limit=2)) == [[1], [2, 3, 4], [5], [6, 7]]
+
+
+class PartialClient(bench.FakeClient):
+    """Forwards from chat 2 fail, and so does every fallback"""
+
+    async def __call__(self, request):
+        self.rpc(type(request).__name__)
+        if request.from_peer.chat_id == 2:
+            raise RuntimeError("boom")
+
+    async def forward_messages(self, entity, messages, **kwargs):
+        raise RuntimeError("boom")
+
+    async def send_message(self, entity, message=None, **kwargs):
+        raise RuntimeError("copy boom")
+
+
+def test_batch_reports_each_delivered_chunk(fresh_bot):
+    # One request per source chat; chat 2's fails along with its fallbacks
+    messages = [bench.FakeMessage(1, chat_id=1), bench.FakeMessage(2, chat_id=1),
+                bench.FakeMessage(3, chat_id=3), bench.FakeMessage(9, chat_id=2)]
+    chunks = []
+    delivered, status = asyncio.run(bot.professional_forward_batch(
+        PartialClient(), InputPeerChat(5), messages, on_delivered=lambda chunk: chunks.append(
+            [m.id for m in chunk])))
+    assert [m.id for m in delivered] == [1, 2, 3]
+    assert chunks == [[1, 2], [3]]
+    assert status.startswith("📦 Batched 3/4")
+
+
+def test_sync_targets_schedules_new_and_drops_removed(fresh_bot):
+    state = bot.account_state('acc1')
+    scheduler = state.scheduler
+    first, second = target("https://t.me/group1"), target("https://t.me/group2")
+    scheduler.sync_targets([first, second])
+    assert set(scheduler.due) == {bot.target_identity(first), bot.target_identity(second)}
+    scheduler.record_sent(second, 'm1', 100.0)
+
+    scheduler.sync_targets([first])
+    assert set(scheduler.due) == {bot.target_identity(first)}
+    assert bot.target_key(second) not in scheduler.sent_log
+
+
+def test_next_due_follows_cooldown_then_backoff(fresh_bot):
+    state = bot.account_state('acc1')
+    group = target()
+    bot.group_cache.put('acc1', bot.entity_cache_key(group), Channel(
+        id=5, title="group", photo=None, date=None, access_hash=1))
+    now = 10_000.0
+    cooldown = bot.settings.cooldown_period
+    state.last_sent_times[bot.cooldown_key(5, group)] = now - 10
+    assert state.scheduler.next_due(group, now) == now - 10 + cooldown
+
+    state.last_sent_times.clear()
+    state.health.records[bot.target_key(group)] = bot.TargetHealth(1, now + 50)
+    assert state.scheduler.next_due(group, now) == now + 50
+    state.health.records.clear()
+    assert state.scheduler.next_due(group, now) == now + cooldown
+
+
+def test_pick_message_prefers_longest_unsent(fresh_bot):
+    state = bot.account_state('acc1')
+    for key in ('m1', 'm2', 'm3'):
+        state.latest_messages.add(key, bot.StoredMessage(1, 1))
+    group = target()
+    state.scheduler.record_sent(group, 'm1', 300.0)
+    state.scheduler.record_sent(group, 'm2', 100.0)
+    assert state.scheduler.pick_message(group) == 'm3'
+    state.scheduler.record_sent(group, 'm3', 200.0)
+    assert state.scheduler.pick_message(group) == 'm2'
+
+
+def test_pick_messages_resumes_a_partial_batch(fresh_bot):
+    state = bot.account_state('acc1')
+    now = time.time()
+    for i, key in enumerate(('m1', 'm2', 'm3')):
+        state.latest_messages.add(key, bot.StoredMessage(1, i), stored_at=now - 100 + i)
+    group = target()
+    bot.group_cache.put('acc1', bot.entity_cache_key(group), Channel(
+        id=5, title="group", photo=None, date=None, access_hash=1))
+    # The first chunk went out, then the run stopped before the send completed
+    state.scheduler.record_sent(group, 'm1', now - 5)
+    assert state.scheduler.pick_messages(group) == ['m2', 'm3']
+
+    # Once a send completes, the next cycle resends everything
+    state.last_sent_times[bot.cooldown_key(5, group)] = now - 1
+    assert state.scheduler.pick_messages(group) == ['m1', 'm2', 'm3']
+
+
+def test_pick_messages_after_restart_skips_checkpointed(fresh_bot, closed_state, tmp_path):
+    path = str(tmp_path / 'state.db')
+    group = target()
+    now = time.time()
+    bot.open_state(path)
+    for i, key in enumerate(('m1', 'm2')):
+        bot.state_store.add_message('acc1', key, bot.StoredMessage(1, i))
+    bot.state_store.record_delivery('acc1', bot.target_key(group), 'm1', now)
+    bot.open_state(path)
+    bot.restore_state()
+    assert bot.account_state('acc1').scheduler.pick_messages(group) == ['m2']
+
+
+def test_worker_checkpoints_and_counts_delivered_messages(fresh_bot):
+    group = target()
+    bench.reset_bot([group], 1e-4)
+    client = bench.FakeClient()
+    state = bot.account_state('acc1')
+    for i in (1, 2):
+        state.latest_messages.add(f"1_{i}_0", bot.StoredMessage(1, i))
+
+    async def scenario():
+        task = asyncio.create_task(bot.auto_forwarder(client, 'acc1'))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert set(state.scheduler.sent_log[bot.target_key(group)]) == {'1_1_0', '1_2_0'}
+    assert bot.sent_counters['acc1'] == 2
+    assert client.rpcs == {'get_entity': 1, 'get_messages': 1, 'ForwardMessagesRequest': 1}
+    [(_, histogram)] = [(k, h) for k, h in bot.metrics.histograms.items()
+                        if k[0] == 'job_duration_seconds']
+    assert histogram.count == 1
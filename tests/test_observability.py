@@ -0,0 +1,97 @@
+"""Metrics export, log filtering and the dry-run planner"""
+import logging
+
+from telethon.tl.types import Channel
+
+import bot
+
+
+def test_render_prometheus():
+    metrics = bot.Metrics()
+    metrics.inc('sends_total', account='acc1', outcome='success')
+    metrics.inc('sends_total', 2, account='acc1', outcome='success')
+    metrics.inc('sends_total', account='acc2', outcome='flood_wait')
+    metrics.set_gauge('queue_depth', 4, account='acc1')
+    metrics.observe('job_duration_seconds', 0.2, account='acc1')
+    metrics.observe('job_duration_seconds', 3, account='acc1')
+
+    lines = metrics.render_prometheus().splitlines()
+    assert "# TYPE sends_total counter" in lines
+    assert 'sends_total{account="acc1",outcome="success"} 3' in lines
+    assert 'sends_total{account="acc2",outcome="flood_wait"} 1' in lines
+    assert "# TYPE queue_depth gauge" in lines
+    assert 'queue_depth{account="acc1"} 4' in lines
+    assert "# TYPE job_duration_seconds histogram" in lines
+    assert 'job_duration_seconds_bucket{account="acc1",le="0.25"} 1' in lines
+    assert 'job_duration_seconds_bucket{account="acc1",le="5"} 2' in lines
+    assert 'job_duration_seconds_bucket{account="acc1",le="+Inf"} 2' in lines
+    assert 'job_duration_seconds_sum{account="acc1"} 3.2' in lines
+    assert 'job_duration_seconds_count{account="acc1"} 2' in lines
+    assert metrics.counter_total('sends_total', outcome='success') == 3
+    assert metrics.counter_total('sends_total') == 4
+
+
+def record(created, sample='cooldown', msg="line"):
+    entry = logging.LogRecord('forwarder', logging.INFO, __file__, 1, msg, None, None)
+    entry.created = created
+    entry.sample = sample
+    return entry
+
+
+def test_sampling_filter_limits_each_kind_per_window():
+    sampler = bot.SamplingFilter(window=60, burst=2)
+    passed = [sampler.filter(record(100 + i)) for i in range(5)]
+    assert passed == [True, True, False, False, False]
+    # Other kinds and unsampled lines have their own budget
+    assert sampler.filter(record(105, sample='pacing'))
+    assert sampler.filter(record(105, sample=None))
+
+    summary = record(160)
+    assert sampler.filter(summary)
+    assert summary.msg == "line (+3 similar lines suppressed)"
+
+
+def test_target_level_filter_uses_overrides(fresh_bot):
+    loud = bot.parse_telegram_link("https://t.me/loud")
+    quiet = bot.parse_telegram_link("https://t.me/quiet")
+    bot.settings = bot.settings._replace(log_level=logging.WARNING)
+    bot.target_overrides = {bot.target_identity(loud): bot.settings._replace(log_level=logging.DEBUG)}
+    level_filter = bot.TargetLevelFilter()
+
+    def line(target, level):
+        entry = logging.LogRecord('forwarder', level, __file__, 1, "line", None, None)
+        entry.target = target
+        return level_filter.filter(entry)
+
+    assert line(loud, logging.DEBUG)
+    assert not line(quiet, logging.INFO)
+    assert line(quiet, logging.WARNING)
+    assert not line(None, logging.INFO)
+
+
+def test_plan_account_orders_and_paces_sends(fresh_bot):
+    now = 100_000.0
+    links = ["https://t.me/fresh", "https://t.me/cooling", "https://t.me/banned",
+             "https://t.me/dead", "https://t.me/unknown"]
+    fresh, cooling, banned, dead, unknown = targets = [bot.parse_telegram_link(l) for l in links]
+    bot.targets = targets
+    bot.settings = bot.settings._replace(delay_between_forwards=10, cooldown_period=3600)
+    state = bot.account_state('acc1')
+    for peer_id, target in enumerate((fresh, cooling, banned), 1):
+        bot.group_cache.put('acc1', bot.entity_cache_key(target), Channel(
+            id=peer_id, title=target.username, photo=None, date=None, access_hash=1))
+    bot.group_cache.put_negative('acc1', bot.entity_cache_key(dead))
+    state.last_sent_times[bot.cooldown_key(2, cooling)] = now - 600
+    state.health.records[bot.target_key(banned)] = bot.TargetHealth(5, now + 999, True, "banned")
+
+    plan = bot.plan_account('acc1', now)
+    by_link = {entry['target']: entry for entry in plan['targets']}
+    assert plan['counts'] == {'send': 2, 'cooldown': 1, 'quarantined': 1, 'unreachable': 1}
+    assert plan['unresolved'] == 1
+    assert by_link["https://t.me/fresh"]['eta'] == now
+    # Sends are spaced by the account delay, in target order
+    assert by_link["https://t.me/unknown"]['eta'] == now + 10
+    assert by_link["https://t.me/cooling"]['eta'] == now + 3000
+    assert by_link["https://t.me/banned"]['reason'] == "banned"
+    assert plan['pass_seconds'] == 10
+    assert plan['completes_at'] == now + 3000
@@ -0,0 +1,46 @@
+"""Token buckets and adaptive pacing"""
+import pytest
+
+import bot
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(bot.time, 'monotonic', clock)
+    return clock
+
+
+def test_token_bucket_burst_then_wait(clock):
+    bucket = bot.TokenBucket(rate=2, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    # Empty: the next token arrives in 1 / rate seconds, the one after in 2 / rate
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+
+
+def test_token_bucket_refills_up_to_capacity(clock):
+    bucket = bot.TokenBucket(rate=1, capacity=2)
+    bucket.reserve()
+    bucket.reserve()
+    clock.now += 60
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(1.0)
+
+
+def test_token_bucket_drain_pushes_next_token_out(clock):
+    bucket = bot.TokenBucket(rate=1, capacity=3)
+    bucket.drain(30)
+    assert bucket.reserve() == pytest.approx(31.0)
+    clock.now += 40
+    assert bucket.reserve() == 0
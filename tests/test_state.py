@@ -0,0 +1,217 @@
+"""Message store limits, the entity cache and the SQLite state store"""
+import sqlite3
+import time
+
+import pytest
+from telethon.tl.types import Channel, InputPeerChannel
+
+import bench
+import bot
+
+
+def make_store(**limits):
+    evicted = []
+    limits.setdefault('max_age', 10 ** 12)
+    store = bot.MessageStore(on_evict=lambda key, reason: evicted.append((key, reason)), **limits)
+    return store, evicted
+
+
+def test_message_store_numbering_ignores_use():
+    store, _ = make_store()
+    for i in range(3):
+        store.add(f"m{i}", bot.StoredMessage(1, i), stored_at=100 + i)
+    store.get('m0')
+    assert store.by_stored_at() == ['m0', 'm1', 'm2']
+
+
+def test_message_store_per_chat_limit_keeps_newest_stored():
+    store, evicted = make_store(per_chat_limit=2)
+    store.add('old', bot.StoredMessage(1, 1), stored_at=100)
+    store.add('mid', bot.StoredMessage(1, 2), stored_at=200)
+    store.get('old')
+    store.add('new', bot.StoredMessage(1, 3), stored_at=300)
+    store.add('other', bot.StoredMessage(2, 1), stored_at=50)
+    assert evicted == [('old', 'chat limit')]
+    assert sorted(store.keys()) == ['mid', 'new', 'other']
+
+
+def test_message_store_size_cap_is_lru():
+    store, evicted = make_store(max_entries=2)
+    store.add('a', bot.StoredMessage(1, 1), stored_at=100)
+    store.add('b', bot.StoredMessage(2, 1), stored_at=200)
+    store.get('a')
+    store.add('c', bot.StoredMessage(3, 1), stored_at=300)
+    assert evicted == [('b', 'store full')]
+
+
+def test_message_store_expires_old_messages(monkeypatch):
+    store, evicted = make_store(max_age=60)
+    monkeypatch.setattr(bot.time, 'time', lambda: 1000.0)
+    store.add('stale', bot.StoredMessage(1, 1), stored_at=900)
+    store.add('fresh', bot.StoredMessage(1, 2), stored_at=990)
+    assert evicted == [('stale', 'expired')]
+    assert store.keys() == ['fresh']
+
+
+def test_read_only_state_never_writes(fresh_bot, closed_state, tmp_path):
+    path = str(tmp_path / 'state.db')
+    bot.open_state(path)
+    now = time.time()
+    for i in range(bot.MAX_MESSAGES_PER_CHAT + 5):
+        bot.state_store.add_message('acc1', f"m{i}", bot.StoredMessage(1, i, f"advert {i}"))
+    bot.state_store.record_delivery('acc1', 'group1', 'm0', now)
+    bot.state_store.close()
+    bot.group_cache.close()
+    saved = open(path, 'rb').read()
+
+    bench.reset_bot([bot.parse_telegram_link("https://t.me/group1")], 1.0)
+    bot.open_state(path, read_only=True)
+    bot.restore_state(persist=False)
+    plan = bot.plan_account('acc1', now)
+    bot.state_store.close()
+    bot.group_cache.close()
+
+    assert plan['messages'] == bot.MAX_MESSAGES_PER_CHAT
+    assert open(path, 'rb').read() == saved
+    # SQLite may add its WAL side files for a reader, but never writes to them
+    wal = tmp_path / 'state.db-wal'
+    assert not wal.exists() or wal.stat().st_size == 0
+
+
+def test_read_only_state_does_not_create_database(fresh_bot, closed_state, tmp_path):
+    bot.open_state(str(tmp_path / 'missing.db'), read_only=True)
+    bot.restore_state(persist=False)
+    assert list(tmp_path.iterdir()) == []
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(bot.time, 'time', clock)
+    return clock
+
+
+def channel(peer_id, title="group"):
+    return Channel(id=peer_id, title=title, photo=None, date=None, access_hash=peer_id * 10)
+
+
+def test_entity_cache_expires_after_ttl(clock):
+    cache = bot.EntityCache(':memory:', ttl=100, negative_ttl=10)
+    cache.put('acc1', 'group', channel(5))
+    entry = cache.get('acc1', 'group')
+    assert (entry['peer_type'], entry['peer_id'], entry['access_hash']) == ('channel', 5, 50)
+    assert bot.EntityCache.to_input_peer(entry) == InputPeerChannel(5, 50)
+
+    clock.now += 100
+    assert cache.peek('acc1', 'group') is None
+    assert ('acc1', 'group') in cache.entries
+    assert cache.get('acc1', 'group') is None
+    assert ('acc1', 'group') not in cache.entries
+
+
+def test_entity_cache_negative_entries_use_their_own_ttl(clock):
+    cache = bot.EntityCache(':memory:', ttl=100, negative_ttl=10)
+    cache.put_negative('acc1', 'deadname')
+    assert cache.get('acc1', 'deadname')['peer_type'] is None
+    clock.now += 10
+    assert cache.get('acc1', 'deadname') is None
+
+
+def test_entity_cache_is_per_session():
+    cache = bot.EntityCache(':memory:')
+    cache.put('acc1', 'group', channel(5))
+    assert cache.get('acc2', 'group') is None
+
+
+def test_entity_cache_batches_writes_until_flush(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = bot.EntityCache(path)
+    cache.put('acc1', 'group', channel(5))
+    cache.put_negative('acc1', 'deadname')
+    reader = sqlite3.connect(path)
+    assert reader.execute("SELECT COUNT(*) FROM entity_cache").fetchone() == (0,)
+    cache.flush()
+    assert reader.execute("SELECT COUNT(*) FROM entity_cache").fetchone() == (2,)
+    cache.invalidate('acc1', 'deadname')
+    cache.close()
+    reader.close()
+
+    reopened = bot.EntityCache(path)
+    assert set(reopened.entries) == {('acc1', 'group')}
+    assert reopened.get('acc1', 'group')['peer_id'] == 5
+    reopened.close()
+
+
+def test_state_store_round_trip(tmp_path):
+    path = str(tmp_path / 'state.db')
+    store = bot.SQLiteStateStore(path)
+    stored = bot.StoredMessage(-100, 7, "advert", bot.MediaDescriptor('photo', 99), 12345)
+    store.add_message('acc1', 'm1', stored)
+    store.add_message('acc1', 'm2', bot.StoredMessage(-100, 8))
+    store.record_delivery('acc1', 'group2', 'm2', 1500.0)
+    store.remove_message('acc1', 'm2')
+    store.set_cooldown('acc1', '555', 1000.0)
+    store.set_counter('acc1', 42)
+    store.set_health('acc1', 'group1', bot.TargetHealth(2, 2000.0, False, "flaky"))
+    store.set_health('acc1', 'group2', bot.TargetHealth(1, 3000.0, True, "banned"))
+    store.clear_health('acc1', 'group1')
+    store.record_delivery('acc1', 'group2', 'm1', 1500.0)
+    store.close()
+
+    saved = bot.SQLiteStateStore(path).load()
+    [(key, (message, _))] = saved['messages']['acc1'].items()
+    assert key == 'm1'
+    assert (message.chat_id, message.message_id, message.text, message.grouped_id) == (-100, 7, "advert", 12345)
+    assert (message.media.kind, message.media.media_id) == ('photo', 99)
+    assert saved['last_sent_times'] == {'acc1': {'555': 1000.0}}
+    assert saved['sent_counters'] == {'acc1': 42}
+    assert saved['target_health'] == {'acc1': {'group2': (1, 3000.0, True, "banned")}}
+    # Removing a message also drops its deliveries
+    assert saved['sent_log'] == {'acc1': {'group2': {'m1': 1500.0}}}
+
+
+def test_state_store_migrates_old_message_table(tmp_path):
+    path = str(tmp_path / 'state.db')
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE messages (session TEXT NOT NULL, message_key TEXT NOT NULL,"
+               " chat_id INTEGER NOT NULL, message_id INTEGER NOT NULL, stored_at REAL NOT NULL,"
+               " PRIMARY KEY (session, message_key))")
+    db.execute("INSERT INTO messages VALUES ('acc1', 'old', 1, 2, 100.0)")
+    db.execute("CREATE TABLE message_queue (session TEXT)")
+    db.commit()
+    db.close()
+
+    store = bot.SQLiteStateStore(path)
+    store.add_message('acc1', 'new', bot.StoredMessage(1, 3, "hello"))
+    store.flush()
+    messages = store.load()['messages']['acc1']
+    assert (messages['old'][0].message_id, messages['old'][0].text) == (2, None)
+    assert messages['new'][0].text == "hello"
+    tables = {row[0] for row in store.db.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    assert 'message_queue' not in tables
+    store.close()
+
+
+def test_restore_state_rebuilds_accounts(fresh_bot, closed_state, tmp_path):
+    path = str(tmp_path / 'state.db')
+    bot.open_state(path)
+    bot.state_store.add_message('acc1', 'm1', bot.StoredMessage(1, 1, "advert"))
+    bot.state_store.set_health('acc1', 'group1', bot.TargetHealth(5, 9e12, True, "banned"))
+    bot.state_store.record_delivery('acc1', 'group1', 'm1', 1500.0)
+    bot.state_store.set_counter('acc1', 3)
+    bot.open_state(path)
+
+    bot.restore_state()
+    state = bot.account_state('acc1')
+    assert state.latest_messages['m1'].text == "advert"
+    assert state.health.records['group1'].quarantined
+    assert state.scheduler.sent_log == {'group1': {'m1': 1500.0}}
+    assert bot.sent_counters['acc1'] == 3